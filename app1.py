@@ -1,28 +1,29 @@
 import flet as ft
-import sqlite3
-import openai
-import os
+import asyncio
+import bisect
+import time
+import db
+import hooks
+import planner
+import batch_plans
+import metrics
+import profiling
+import recorder
+import task_cache
 from login import LoginPage
-from dotenv import load_dotenv
 
-conn = sqlite3.connect('tasks.db')
-cursor = conn.cursor()
-
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
-    )
-''')
-
-conn.commit()
-conn.close()
+# Upper bound on repaints per second while a plan streams in
+PLAN_FPS = 15
 
 class Task(ft.Column):
-    def __init__(self, task_name, task_status_change, task_delete, task_id=None, completed=False):
+    def __init__(self, task_name, task_status_change, task_delete, task_id=None, completed=False, user_id=None,
+                 task_rename=None, due_date=None, position=0):
         super().__init__()
         self.task_id = task_id
+        self.due_date = due_date
+        self.position = position
+        self.user_id = user_id
+        self.task_rename = task_rename
         self.completed = completed
         self.task_name = task_name
         self.task_status_change = task_status_change
@@ -30,7 +31,6 @@ class Task(ft.Column):
         self.display_task = ft.Checkbox(
             value=self.completed, label=self.task_name, on_change=self.status_changed, active_color=ft.Colors.PURPLE_ACCENT
         )
-        self.edit_name = ft.TextField(expand=1, border_color=ft.Colors.GREY)
 
         self.popup_menu = ft.PopupMenuButton(
             icon=ft.Icons.MORE_VERT,
@@ -53,23 +53,23 @@ class Task(ft.Column):
             ]
         )
 
-        self.expansion_tile = ft.ExpansionTile(
-            title=ft.Text("show plan"),
-            controls=[ft.Text("No plan available yet.")]
-        )
-
         self.display_view = ft.Row(
             alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
             vertical_alignment=ft.CrossAxisAlignment.CENTER,
-            controls=[
-                self.display_task,
-                ft.Row(
-                    spacing=10,
-                    controls=[self.popup_menu],
-                ),
-            ],
+            controls=[self.display_task, self.popup_menu],
         )
 
+        # The edit row and the plan tile are built on first use; most tasks
+        # are never edited or planned.
+        self.edit_name = None
+        self.edit_view = None
+        self.expansion_tile = None
+        self.plan_job = None
+
+        self.controls = [self.display_view]
+
+    def build_edit_view(self):
+        self.edit_name = ft.TextField(expand=1, border_color=ft.Colors.GREY)
         self.edit_view = ft.Row(
             visible=False,
             alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
@@ -84,97 +84,338 @@ class Task(ft.Column):
                 ),
             ],
         )
-
-        self.controls = [self.display_view, self.edit_view, self.expansion_tile]
-
+        self.controls.insert(1, self.edit_view)
+
+    def plan_tile(self):
+        if self.expansion_tile is None:
+            self.expansion_tile = ft.ExpansionTile(title=ft.Text("show plan"))
+            self.controls.append(self.expansion_tile)
+        return self.expansion_tile
+
+    def show_plan_progress(self):
+        tile = self.plan_tile()
+        tile.title = ft.Row([ft.ProgressRing(width=16, height=16, stroke_width=2), ft.Text("Generating plan...")])
+        tile.trailing = ft.IconButton(icon=ft.Icons.CLOSE, tooltip="Cancel", on_click=self.cancel_plan)
+        tile.controls = [ft.Text("")]
+
+    def show_plan(self, text):
+        tile = self.plan_tile()
+        tile.title = ft.Text("show plan")
+        tile.trailing = None
+        tile.controls = [ft.Text(text)]
+
+    @hooks.handler
     def edit_clicked(self, e):
+        if self.edit_view is None:
+            self.build_edit_view()
         self.edit_name.value = self.display_task.label
         self.display_view.visible = False
         self.edit_view.visible = True
         self.update()
 
+    @hooks.handler
     def save_clicked(self, e):
-        self.display_task.label = self.edit_name.value
+        self.task_name = self.edit_name.value
+        self.display_task.label = self.task_name
         self.display_view.visible = True
         self.edit_view.visible = False
         self.update()
 
         # Update task name in the database
-        conn = sqlite3.connect("tasks.db")
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tasks SET task_name = ? WHERE id = ?", (self.display_task.label, self.task_id))
-        conn.commit()
-        conn.close()
+        db.update_task_name(self.task_id, self.display_task.label)
+        if self.task_rename is not None:
+            self.task_rename(self)
+
+    def row(self):
+        return (self.task_id, self.task_name, self.completed, self.due_date, self.position)
 
+    def set_row(self, task_name, completed, position):
+        self.position = position
+        self.task_name = task_name
+        self.display_task.label = task_name
+        self.completed = completed
+        self.display_task.value = completed
+
+    @hooks.handler
     def status_changed(self, e):
         self.completed = self.display_task.value
         self.task_status_change(self)
 
         # Update task status in the database
-        conn = sqlite3.connect("tasks.db")
-        cursor = conn.cursor()
-        cursor.execute("UPDATE tasks SET completed = ? WHERE id = ?", (self.completed, self.task_id))
-        conn.commit()
-        conn.close()
+        db.update_task_completed(self.task_id, self.completed)
 
+    @hooks.handler
     def delete_clicked(self, e):
         self.task_delete(self)
 
         # Delete task from the database
-        conn = sqlite3.connect("tasks.db")
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM tasks WHERE id = ?", (self.task_id,))
-        conn.commit()
-        conn.close()
+        db.delete_task(self.task_id)
 
+    @hooks.handler
     def create_plan(self, e):
-        load_dotenv(override = True)
-        
-        API_KEY = os.environ.get('OPENAI_API_KEY', "dont-know")
-        MODEL = "gpt-3.5-turbo"
+        if self.plan_job is not None and not self.plan_job.done():
+            return
+        cached = planner.get_cached_plan(self.task_name)
+        if cached is not None:
+            self.response_var = cached
+            self.show_plan(cached)
+            self.update()
+            return
+        self.show_plan_progress()
+        self.update()
+        self.plan_job = self.page.run_task(self.generate_plan)
 
-        openai.api_key = API_KEY
+    @hooks.handler
+    def cancel_plan(self, e):
+        if self.plan_job is not None:
+            self.plan_job.cancel()
 
+    async def generate_plan(self):
+        self.response_var = ""
+        last_update = 0
         try:
-            response = openai.chat.completions.create(
-                model=MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant. Create a detailed plan to \
-                     achieve the given goal, breaking it down into actionable steps with a timeline. Make sure \
-                     the plan is practical and achievable, including daily or weekly tasks, milestones, and any \
-                     additional tips or resources that might be helpful. Format the output in a proffesional manner \
-                     goal as a key and the plan/steps as sub-keys."},
-                    {"role": "user", "content": self.task_name}
-                ]
-            )
-            self.response_var = response.choices[0].message.content
-
-            self.expansion_tile.controls = [ft.Text(f"{self.response_var}")]
-            self.update()
-
+            async for text in planner.stream_plan(self.task_name, self.user_id):
+                self.response_var += text
+                # Repaint at most PLAN_FPS times a second however fast tokens arrive
+                now = time.monotonic()
+                if now - last_update >= 1 / PLAN_FPS:
+                    last_update = now
+                    self.expansion_tile.controls[0].value = self.response_var
+                    self.update()
+            # Off the event loop, which every session shares
+            await asyncio.to_thread(planner.save_plan, self.task_name, self.response_var)
+        except asyncio.CancelledError:
+            self.response_var = "Plan generation cancelled"
         except Exception as ex:
             print(f"Error while generating plan: {ex}")
             self.response_var = "Error generating plan"
-            self.expansion_tile.controls = [ft.Text(f"{self.response_var}")]
+
+        self.show_plan(self.response_var)
+        self.update()
+
+# Rows fetched per page and how close (in pixels) to the bottom of the list
+# the user has to scroll before the next page is fetched.
+PAGE_SIZE = 50
+LOAD_MORE_THRESHOLD = 200
+TASK_LIST_HEIGHT = 500
+
+class SessionChanges:
+    # Spreads task changes to every view of the user: this session's other
+    # views directly and other sessions' views over page.pubsub. Messages
+    # only carry ids; the rows themselves are in task_cache.
+    def __init__(self, page=None, user_id=None):
+        self.page = page
+        self.user_id = user_id
+        self.views = []
+        if page is not None:
+            page.pubsub.subscribe_topic(self.topic(), self.received)
+
+    def topic(self):
+        return f"tasks/{self.user_id}"
+
+    def publish(self, origin, rows=(), deleted_ids=(), active_delta=0):
+        task_cache.put(self.user_id, rows, deleted_ids)
+        change = {"ids": [row[0] for row in rows] + list(deleted_ids), "active_delta": active_delta}
+        self.deliver(origin, change)
+        if self.page is not None:
+            self.page.pubsub.send_others_on_topic(self.topic(), change)
+
+    def deliver(self, origin, change):
+        for view in self.views:
+            if view.tasks is not origin:
+                view.apply_changes(change["ids"], change["active_delta"])
+
+    def received(self, topic, change):
+        self.deliver(None, change)
+        self.page.update()
+
+class TaskList(ft.ReorderableListView):
+    def __init__(self, user_id, task_status_change, task_delete, task_rename=None, completed=None, due_date=None,
+                 task_move=None):
+        super().__init__(
+            height=TASK_LIST_HEIGHT, on_scroll_interval=100, on_scroll=self.scrolled, on_reorder=self.reordered
+        )
+        self.user_id = user_id
+        self.task_move = task_move
+        # None lists undated tasks, a date that day's recurring tasks
+        self.due_date = due_date
+        self.task_status_change = task_status_change
+        self.task_delete = task_delete
+        self.task_rename = task_rename
+        self.query = ""
+        self.set_filter(completed)
+
+    def set_query(self, query):
+        # A non-empty query shows matching tasks, best match first
+        self.query = query.strip()
+        self.set_filter(self.completed)
+
+    def set_filter(self, completed):
+        # None shows every task, True/False only completed/active ones
+        self.completed = completed
+        self.controls = []
+        # (position, id) of the last row loaded
+        self.last_key = None
+        self.offset = 0
+        self.exhausted = False
+        # Rows changed elsewhere while this list was hidden
+        self.dirty_ids = set()
+        self.load_more()
+
+    def make_task(self, row):
+        return Task(
+            row[1], self.task_status_change, self.task_delete, task_id=row[0], completed=row[2],
+            user_id=self.user_id, task_rename=self.task_rename, due_date=row[3], position=row[4]
+        )
+
+    def matches(self, task):
+        if task.due_date != self.due_date:
+            return False
+        return self.completed is None or bool(task.completed) == self.completed
+
+    def load_more(self):
+        if self.query:
+            rows = db.search_tasks(self.user_id, self.query, self.completed, offset=self.offset, limit=PAGE_SIZE)
+        else:
+            rows = db.load_tasks(
+                self.user_id, completed=self.completed, after=self.last_key, limit=PAGE_SIZE, due_date=self.due_date
+            )
+        plans = planner.get_cached_plans([row[1] for row in rows])
+        for row in rows:
+            task = self.make_task(row)
+            if row[1] in plans:
+                task.response_var = plans[row[1]]
+                task.show_plan(task.response_var)
+            self.controls.append(task)
+        if rows:
+            self.last_key = (rows[-1][4], rows[-1][0])
+        self.offset += len(rows)
+        self.exhausted = len(rows) < PAGE_SIZE
+
+    def append_task(self, task):
+        # New tasks go last, so until the list is fully paged in they arrive
+        # with the last page; in search results once the query changes
+        if self.query or not self.exhausted or not self.matches(task):
+            return
+        self.controls.append(task)
+
+    def refresh(self):
+        if self.dirty_ids:
+            self.refresh_rows(self.dirty_ids)
+            self.dirty_ids = set()
+
+    def refresh_rows(self, task_ids):
+        task_ids = set(task_ids)
+        rows = task_cache.get_rows(self.user_id, task_ids)
+        if self.query:
+            # Search results keep their rank order
+            kept = []
+            for task in self.controls:
+                if task.task_id in task_ids:
+                    row = rows.get(task.task_id)
+                    if row is None:
+                        continue
+                    task.set_row(row[1], row[2], row[4])
+                    if not self.matches(task):
+                        continue
+                kept.append(task)
+            self.controls = kept
+            return
+
+        changed = {}
+        kept = []
+        for task in self.controls:
+            if task.task_id not in task_ids:
+                kept.append(task)
+                continue
+            row = rows.pop(task.task_id, None)
+            if row is None:
+                continue
+            if row[4] != task.position:
+                changed[task.task_id] = (task, row)
+                continue
+            task.set_row(row[1], row[2], row[4])
+            if self.matches(task):
+                kept.append(task)
+        self.controls = kept
+        for row in rows.values():
+            changed[row[0]] = (None, row)
+        if not changed:
+            return
+
+        # Moved and new rows are placed by position. Positions may have been
+        # renumbered since the list was loaded, so take them all fresh.
+        task_ids = [task.task_id for task in self.controls] + list(changed)
+        positions = {row[0]: row[4] for row in db.get_tasks(self.user_id, task_ids)}
+        for task in self.controls:
+            task.position = positions.get(task.task_id, task.position)
+        self.reset_last_key()
+        for task_id, (task, row) in changed.items():
+            position = positions.get(task_id, row[4])
+            # Rows past the loaded pages will arrive with their page
+            if not self.exhausted and (self.last_key is None or (position, task_id) > self.last_key):
+                continue
+            if task is None:
+                task = self.make_task(row)
+            task.set_row(row[1], row[2], position)
+            if self.matches(task):
+                bisect.insort(self.controls, task, key=lambda task: (task.position, task.task_id))
+
+    def reset_last_key(self):
+        # After a move the loaded rows are still every row up to the last
+        # one shown, wherever the previous last row went
+        self.last_key = (self.controls[-1].position, self.controls[-1].task_id) if self.controls else None
+
+    @hooks.handler
+    def reordered(self, e):
+        if e.old_index == e.new_index or self.query:
             self.update()
+            return
+        task = self.controls.pop(e.old_index)
+        self.controls.insert(e.new_index, task)
+        before = self.controls[e.new_index - 1] if e.new_index > 0 else None
+        task.position = db.move_task(task.task_id, before.task_id if before is not None else None)
+        self.reset_last_key()
+        if self.task_move is not None:
+            self.task_move(task)
+        self.update()
+
+    @hooks.handler
+    def scrolled(self, e):
+        if self.exhausted or e.pixels < e.max_scroll_extent - LOAD_MORE_THRESHOLD:
+            return
+        self.load_more()
+        self.update()
+
+WEEKDAY_LABELS = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
 
 class DailyTasksApp(ft.Column):
-    def __init__(self, page, drawer_button, drawer):
+    def __init__(self, page, drawer_button, drawer, user_id, changes=None):
         super().__init__()
 
         self.page = page
+        self.user_id = user_id
+        self.changes = changes or SessionChanges(user_id=user_id)
+        self.changes.views.append(self)
         self.new_task = ft.TextField(
-            hint_text="What needs to be done today?", on_submit=self.add_clicked, expand=True,
+            hint_text="What needs to be done every day?", on_submit=self.add_clicked, expand=True,
             border_color=ft.Colors.GREY
         )
-        self.tasks = ft.Column()
+        self.weekdays = [ft.Checkbox(label=label, value=True) for label in WEEKDAY_LABELS]
+
+        # Today's instances are created on the first load of the day
+        self.today = db.today()
+        db.schedule_day(self.user_id, self.today)
+        self.tasks = TaskList(
+            self.user_id, self.task_status_change, self.task_delete, self.task_rename, due_date=self.today,
+            task_move=self.task_move
+        )
+        self.summary = ft.Text()
+        self.update_summary()
 
         self.drawer_button = drawer_button
         self.drawer = drawer
 
-        # Load tasks from the database
-        self.load_tasks_from_db()
-
         self.controls = [
             self.drawer_button,  # Add the drawer button for navigation
             ft.Row(
@@ -193,100 +434,95 @@ class DailyTasksApp(ft.Column):
                 ],
                 alignment=ft.MainAxisAlignment.START
             ),
+            ft.Row(self.weekdays, spacing=0, wrap=True),
             ft.Column(
                 spacing=25,
-                controls=[self.tasks],
+                controls=[self.tasks, self.summary],
             ),
         ]
         self.width = 500
         self.padding = ft.Padding(20, 20, 20, 20)
         self.bgcolor = ft.Colors.LIGHT_BLUE_50
 
+    def update_summary(self):
+        done = db.count_tasks(self.user_id, True, self.today)
+        left = db.count_tasks(self.user_id, False, self.today)
+        text = f"{done} of {done + left} done today"
+        streaks = db.streaks(self.user_id, self.today)
+        if streaks:
+            task_name, streak = max(streaks.items(), key=lambda item: item[1])
+            if streak:
+                text += f" · longest streak: {streak} day(s) of {task_name}"
+        self.summary.value = text
+
+    @hooks.handler
     def add_clicked(self, e):
-        if self.new_task.value:
-            task = Task(self.new_task.value, self.task_status_change, self.task_delete)
-            self.tasks.controls.append(task)
+        weekdays = sum(1 << day for day, checkbox in enumerate(self.weekdays) if checkbox.value)
+        if self.new_task.value and weekdays:
+            # Add the recurring task and, if it is due today, today's instance
+            recurrence_id, task_id = db.add_recurrence(self.user_id, self.new_task.value, weekdays, self.today)
+            if task_id is not None:
+                task = Task(
+                    self.new_task.value, self.task_status_change, self.task_delete, task_id=task_id,
+                    user_id=self.user_id, task_rename=self.task_rename, due_date=self.today, position=recurrence_id
+                )
+                self.tasks.append_task(task)
+                self.changes.publish(self.tasks, rows=[task.row()])
             self.new_task.value = ""
             self.new_task.focus()
+            self.update_summary()
             self.update()
 
-            # Add the new task to the database
-            conn = sqlite3.connect("tasks.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO tasks (task_name, completed) VALUES (?, ?)", (task.task_name, task.completed))
-            conn.commit()
-            conn.close()
-
     def task_status_change(self, task):
+        # Task writes the same update right after this returns; the write
+        # queue merges the two, and the summary below already counts it.
+        db.update_task_completed(task.task_id, task.completed)
+        self.changes.publish(self.tasks, rows=[task.row()])
+        self.update_summary()
         self.update()
 
     def task_delete(self, task):
+        # Deleting today's instance stops the task from recurring
+        db.end_recurrence(task.task_id)
+        db.delete_task(task.task_id)
         self.tasks.controls.remove(task)
+        self.changes.publish(self.tasks, deleted_ids=[task.task_id])
+        self.update_summary()
         self.update()
 
-    def load_tasks_from_db(self):
-        conn = sqlite3.connect("tasks.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, task_name, completed FROM tasks")
-        rows = cursor.fetchall()
-        for row in rows:
-            task = Task(row[1], self.task_status_change, self.task_delete, task_id=row[0], completed=row[2])
-            self.tasks.controls.append(task)
-        conn.close()
-
-def daily_tasks(page: ft.Page):
-    page.title = "Daily Tasks"
-    page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
-    page.scroll = ft.ScrollMode.ADAPTIVE
-
-    drawer_button = ft.IconButton(icon=ft.Icons.MENU, on_click=lambda e: page.open(drawer))
-
-    drawer = ft.NavigationDrawer(
-        selected_index=0,
-        controls=[
-            ft.Container(height=12),
-            ft.NavigationDrawerDestination(
-                label="To-Do List",
-                icon=ft.Icons.LIST,
-                selected_icon=ft.Icon(ft.Icons.LIST_ALT),
-            ),
-            ft.Divider(thickness=2),
-            ft.NavigationDrawerDestination(
-                label="Daily Tasks",
-                icon=ft.Icons.DATE_RANGE,
-                selected_icon=ft.Icon(ft.Icons.DATE_RANGE),
-            ),
-            ft.NavigationDrawerDestination(
-                label="Switch Modes",
-                icon=ft.Icons.DARK_MODE_OUTLINED,
-            ),
-        ]
-    )
-
-    def on_drawer_index_change(e):
-        selected_index = drawer.selected_index
-        if selected_index == 0:
-            page.clean()
-            page.add(TodoApp(drawer_button, drawer, page))
-        elif selected_index == 1:
-            page.clean()
-            daily_tasks(page)
-        elif selected_index == 2:
-            if page.theme_mode == ft.ThemeMode.LIGHT:
-                page.theme_mode = ft.ThemeMode.DARK
-            else:
-                page.theme_mode = ft.ThemeMode.LIGHT
-            page.update()
-
-    drawer.on_change = on_drawer_index_change
-
-    page.add(DailyTasksApp(page, drawer_button, drawer))
+    def task_rename(self, task):
+        db.rename_recurrence(task.task_id, task.task_name)
+        self.changes.publish(self.tasks, rows=[task.row()])
+
+    def task_move(self, task):
+        self.changes.publish(self.tasks, rows=[task.row()])
+
+    def apply_changes(self, task_ids, active_delta):
+        if self.visible is False:
+            self.tasks.dirty_ids.update(task_ids)
+        else:
+            self.tasks.refresh_rows(task_ids)
+            self.update_summary()
+
+    def refresh_changed(self):
+        if self.today != db.today():
+            # Shown again on a new day
+            self.today = db.today()
+            db.schedule_day(self.user_id, self.today)
+            self.tasks.due_date = self.today
+            self.tasks.set_filter(None)
+        else:
+            self.tasks.refresh()
+        self.update_summary()
 
 class TodoApp(ft.Column):
-    def __init__(self, drawer_button, drawer, page):
+    def __init__(self, drawer_button, drawer, page, user_id, changes=None):
         super().__init__()
 
         self.page = page
+        self.user_id = user_id
+        self.changes = changes or SessionChanges(user_id=user_id)
+        self.changes.views.append(self)
         self.drawer_button = drawer_button
         self.drawer = drawer
 
@@ -294,7 +530,13 @@ class TodoApp(ft.Column):
             hint_text="What needs to be done?", on_submit=self.add_clicked, expand=True,
             border_color=ft.Colors.GREY
         )
-        self.tasks = ft.Column()
+        self.tasks = TaskList(
+            self.user_id, self.task_status_change, self.task_delete, self.task_rename, task_move=self.task_move
+        )
+        self.search = ft.TextField(
+            hint_text="Search tasks and plans", prefix_icon=ft.Icons.SEARCH, on_change=self.search_changed,
+            border_color=ft.Colors.GREY, dense=True
+        )
 
         self.filter = ft.Tabs(
             scrollable=False,
@@ -304,6 +546,8 @@ class TodoApp(ft.Column):
         )
 
         self.items_left = ft.Text("0 items left")
+        self.plan_all_button = ft.OutlinedButton(text="Plan all open tasks", on_click=self.plan_all_clicked)
+        self.active_count = db.count_tasks(self.user_id, False)
 
         self.width = 500
         self.controls = [
@@ -326,66 +570,115 @@ class TodoApp(ft.Column):
             ),
             ft.Column(
                 spacing=25,
-                controls=[self.filter, self.tasks, ft.Row(
+                controls=[self.search, self.filter, self.tasks, ft.Row(
                     alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                     vertical_alignment=ft.CrossAxisAlignment.CENTER,
                     controls=[self.items_left, ft.OutlinedButton(text="Clear completed", on_click=self.clear_clicked)]
-                )],
+                ), ft.Row([self.plan_all_button], alignment=ft.MainAxisAlignment.END)],
             ),
         ]
         self.padding = ft.Padding(20, 20, 20, 20)
         self.bgcolor = ft.Colors.LIGHT_BLUE_50
 
+    @hooks.handler
     def add_clicked(self, e):
         if self.new_task.value:
-            task = Task(self.new_task.value, self.task_status_change, self.task_delete)
-            self.tasks.controls.append(task)
+            task = Task(
+                self.new_task.value, self.task_status_change, self.task_delete, user_id=self.user_id,
+                task_rename=self.task_rename
+            )
+
+            # Add the new task to the database
+            task.task_id = db.add_task(self.user_id, task.task_name, task.completed)
+            task.position = db.get_tasks(self.user_id, [task.task_id])[0][4]
+
+            self.tasks.append_task(task)
+            self.changes.publish(self.tasks, rows=[task.row()], active_delta=1)
+            self.active_count += 1
             self.new_task.value = ""
             self.new_task.focus()
             self.update()
 
-            # Add the new task to the database
-            conn = sqlite3.connect("tasks.db")
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO tasks (task_name, completed) VALUES (?, ?)", (task.task_name, task.completed))
-            conn.commit()
-            conn.close()
-
     def task_status_change(self, task):
+        active_delta = -1 if task.completed else 1
+        self.active_count += active_delta
+        if not self.tasks.matches(task):
+            self.tasks.controls.remove(task)
+        self.changes.publish(self.tasks, rows=[task.row()], active_delta=active_delta)
         self.update()
 
     def task_delete(self, task):
+        active_delta = 0 if task.completed else -1
+        self.active_count += active_delta
         self.tasks.controls.remove(task)
+        self.changes.publish(self.tasks, deleted_ids=[task.task_id], active_delta=active_delta)
         self.update()
 
+    def task_rename(self, task):
+        self.changes.publish(self.tasks, rows=[task.row()])
+
+    def task_move(self, task):
+        self.changes.publish(self.tasks, rows=[task.row()])
+
+    def apply_changes(self, task_ids, active_delta):
+        self.active_count += active_delta
+        if self.visible is False:
+            self.tasks.dirty_ids.update(task_ids)
+        else:
+            self.tasks.refresh_rows(task_ids)
+
+    def refresh_changed(self):
+        self.tasks.refresh()
+
+    @hooks.handler
+    def search_changed(self, e):
+        self.tasks.set_query(self.search.value)
+        self.update()
+
+    @hooks.handler
     def tabs_changed(self, e):
+        status = self.filter.tabs[self.filter.selected_index].text
+        self.tasks.set_filter({"All": None, "Active": False, "Completed": True}[status])
         self.update()
 
+    @hooks.handler
     def clear_clicked(self, e):
-        for task in self.tasks.controls[:]:
-            if task.completed:
-                self.task_delete(task)
+        deleted_ids = db.delete_completed(self.user_id)
+        self.tasks.controls = [task for task in self.tasks.controls if not task.completed]
+        self.changes.publish(self.tasks, deleted_ids=deleted_ids)
+        self.update()
 
-    def before_update(self):
-        status = self.filter.tabs[self.filter.selected_index].text
-        count = 0
+    @hooks.handler
+    def plan_all_clicked(self, e):
+        self.plan_all_button.disabled = True
+        self.plan_all_button.text = "Planning..."
+        self.update()
+        self.page.run_task(self.plan_all)
+
+    async def plan_all(self):
+        try:
+            await batch_plans.plan_all(self.user_id)
+        except Exception as ex:
+            print(f"Error while generating plans: {ex}")
+
+        plans = await asyncio.to_thread(planner.get_cached_plans, [task.task_name for task in self.tasks.controls])
         for task in self.tasks.controls:
-            task.visible = (
-                status == "All"
-                or (status == "Active" and task.completed == False)
-                or (status == "Completed" and task.completed)
-            )
-            if not task.completed:
-                count += 1
-        self.items_left.value = f"{count} active item(s) left"
+            plan_running = task.plan_job is not None and not task.plan_job.done()
+            if task.task_name in plans and not plan_running:
+                task.response_var = plans[task.task_name]
+                task.show_plan(task.response_var)
+        self.plan_all_button.disabled = False
+        self.plan_all_button.text = "Plan all open tasks"
+        self.update()
+
+    def before_update(self):
+        self.items_left.value = f"{self.active_count} active item(s) left"
 
 def main(page: ft.Page):
     page.title = "ToDo App"
     page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
     page.scroll = ft.ScrollMode.ADAPTIVE
 
-    drawer_button = ft.IconButton(icon=ft.Icons.MENU, on_click=lambda e: page.open(drawer))
-
     drawer = ft.NavigationDrawer(
         selected_index=0,
         controls=[
@@ -408,27 +701,62 @@ def main(page: ft.Page):
         ]
     )
 
-    def on_drawer_index_change(e):
+    # One instance of each view per session; navigating toggles visibility
+    # instead of rebuilding the view from the database.
+    views = {}
+    changes = None
+    user_id = None
+    current_index = 0
+
+    def show_view(index):
+        nonlocal current_index
+        current_index = index
+        if index not in views:
+            drawer_button = ft.IconButton(icon=ft.Icons.MENU, on_click=lambda e: page.open(drawer))
+            if index == 0:
+                views[index] = TodoApp(drawer_button, drawer, page, user_id, changes)
+            else:
+                views[index] = DailyTasksApp(page, drawer_button, drawer, user_id, changes)
+            page.add(views[index])
+        else:
+            views[index].refresh_changed()
+        for view_index, view in views.items():
+            view.visible = view_index == index
+        page.title = "ToDo App" if index == 0 else "Daily Tasks"
+        page.update()
+
+    # Handlers reach the session through their arguments; e is None when
+    # the drawer is driven without a client, so the page is passed in
+    @hooks.handler
+    def on_drawer_index_change(page, e):
         selected_index = drawer.selected_index
-        if selected_index == 0:
-            page.clean()
-            page.add(TodoApp(drawer_button, drawer, page))
-        elif selected_index == 1:
-            page.clean()
-            daily_tasks(page)
+        if selected_index in (0, 1):
+            show_view(selected_index)
         elif selected_index == 2:
             if page.theme_mode == ft.ThemeMode.LIGHT:
                 page.theme_mode = ft.ThemeMode.DARK
             else:
                 page.theme_mode = ft.ThemeMode.LIGHT
+            drawer.selected_index = current_index
             page.update()
 
-    drawer.on_change = on_drawer_index_change
+    # What page.open(drawer) would set, so the drawer is found from the page
+    # before it is first opened
+    page.drawer = drawer
+    drawer.on_change = lambda e: on_drawer_index_change(page, e)
 
-    def on_login_success():
+    def on_login_success(logged_in_user_id):
+        nonlocal user_id, changes
+        user_id = logged_in_user_id
+        changes = SessionChanges(page, user_id)
         page.clean()
-        page.add(TodoApp(drawer_button, drawer, page))
+        show_view(0)
 
     page.add(LoginPage(on_login_success=on_login_success))
 
-ft.app(main)
\ No newline at end of file
+if __name__ == "__main__":
+    recorder.start_from_env()
+    # Profiling outermost, so its snapshots aren't in the handler timings
+    profiling.start_from_env()
+    metrics.start_from_env()
+    ft.app(main)
\ No newline at end of file
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import db
+import planner
+
+# How often a running batch is polled, in seconds
+POLL_INTERVAL = 30
+
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def unplanned_task_names(user_id):
+    task_names = {row[1] for row in db.load_tasks(user_id, completed=False)}
+    planned = planner.get_cached_plans(list(task_names))
+    return sorted(task_names - planned.keys())
+
+
+def build_batch(task_names):
+    # One chat request per distinct plan; custom_id is the cache key, so
+    # results can be written straight into the plan cache.
+    lines = {}
+    for task_name in task_names:
+        key = planner.plan_key(task_name)
+        lines[key] = json.dumps({
+            "custom_id": key,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": planner.MODEL,
+                "messages": [
+                    {"role": "system", "content": planner.SYSTEM_PROMPT},
+                    {"role": "user", "content": task_name}
+                ]
+            }
+        })
+    return "\n".join(lines.values()).encode()
+
+
+async def submit_batch(client, task_names):
+    batch_file = await client.files.create(file=("plans.jsonl", build_batch(task_names)), purpose="batch")
+    return await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+
+async def wait_for_batch(client, batch_id, poll_interval=POLL_INTERVAL):
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in FINISHED_STATUSES:
+            return batch
+        await asyncio.sleep(poll_interval)
+
+
+def parse_results(text):
+    for line in text.splitlines():
+        if not line:
+            continue
+        result = json.loads(line)
+        response = result.get("response")
+        if response and response.get("status_code") == 200:
+            yield result["custom_id"], response["body"]["choices"][0]["message"]["content"]
+
+
+async def store_results(client, batch, goals):
+    # goals: plan key -> normalized goal of the tasks in the batch
+    if batch.output_file_id is None:
+        return 0
+    content = await client.files.content(batch.output_file_id)
+    plans = [(key, goals.get(key, ''), plan) for key, plan in parse_results(content.text)]
+    await asyncio.to_thread(db.put_plans, plans)
+    return len(plans)
+
+
+async def plan_all(user_id, poll_interval=POLL_INTERVAL):
+    # Returns how many plans were written to the cache. This runs on Flet's
+    # event loop, which every session shares, so the database work is done
+    # on a worker thread.
+    task_names = await asyncio.to_thread(unplanned_task_names, user_id)
+    if not task_names:
+        return 0
+    client = await planner.get_client_async()
+    batch = await submit_batch(client, task_names)
+    batch = await wait_for_batch(client, batch.id, poll_interval)
+    goals = {planner.plan_key(task_name): db.normalize_goal(task_name) for task_name in task_names}
+    return await store_results(client, batch, goals)
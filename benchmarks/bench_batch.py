@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import planner
+import batch_plans
+import fake_openai
+
+TASKS = 50
+LATENCY = 0.2
+BATCH_LATENCY = 1.0
+
+# USD per 1M tokens for gpt-3.5-turbo; the Batch API bills half of that
+PRICE_PER_MILLION_TOKENS = 1.0
+BATCH_DISCOUNT = 0.5
+
+
+def cost(task_names, discount=1.0):
+    tokens = sum(fake_openai.usage(fake_openai.fake_plan(task_name))["total_tokens"] for task_name in task_names)
+    return tokens * PRICE_PER_MILLION_TOKENS / 1_000_000 * discount
+
+
+async def sequential(task_names):
+    for task_name in task_names:
+        plan = "".join([text async for text in planner.stream_plan(task_name)])
+        planner.save_plan(task_name, plan)
+
+
+async def run(user_id, task_names, server):
+    start = time.perf_counter()
+    await sequential(task_names)
+    elapsed = time.perf_counter() - start
+    print(f"sequential {elapsed:>7.2f} s  {server.chat_requests:>3} requests  ${cost(task_names):.4f}")
+
+    db.get_connection().execute("DELETE FROM plans")
+    db.get_connection().commit()
+
+    start = time.perf_counter()
+    stored = await batch_plans.plan_all(user_id, poll_interval=0.1)
+    elapsed = time.perf_counter() - start
+    print(f"batch      {elapsed:>7.2f} s  {server.batch_requests:>3} requests  "
+          f"${cost(task_names, BATCH_DISCOUNT):.4f}  ({stored} plans stored)")
+
+
+def main():
+    server = fake_openai.start(latency=LATENCY, batch_latency=BATCH_LATENCY)
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        db.add_user('bench', 'bench')
+        user_id = db.get_user('bench')[0]
+        task_names = [f"goal {i}" for i in range(TASKS)]
+        for task_name in task_names:
+            db.add_task(user_id, task_name)
+
+        asyncio.run(run(user_id, task_names, server))
+        db.close_all()
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flet as ft
+import db
+import app1
+
+COMPLETED = 10_000
+ACTIVE = 100
+
+
+class FakePage:
+    def __init__(self):
+        self.updates = 0
+
+    def update(self, *controls):
+        self.updates += 1
+
+
+def build_view(user_id):
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM tasks")
+        conn.executemany(
+            "INSERT INTO tasks (task_name, completed, user_id) VALUES (?, ?, ?)",
+            ((f"task {i}", i >= ACTIVE, user_id) for i in range(COMPLETED + ACTIVE))
+        )
+    page = FakePage()
+    view = app1.TodoApp(ft.IconButton(icon=ft.Icons.MENU), None, page, user_id)
+    view._build_add_commands(index={"page": page})
+    page.updates = 0
+    return view, page
+
+
+def per_item_clear(view):
+    # The old loop: remove each completed task and update after every one,
+    # plus the per-row DELETE it should have issued.
+    for task in view.tasks.controls[:]:
+        if task.completed:
+            view.task_delete(task)
+            db.delete_task(task.task_id)
+    db.flush()
+
+
+def bulk_clear(view):
+    view.clear_clicked(None)
+
+
+def main():
+    # Load every row into the list so both paths see all 10k controls
+    app1.PAGE_SIZE = COMPLETED + ACTIVE + 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        db.add_user('bench', 'bench')
+        user_id = db.get_user('bench')[0]
+
+        for name, clear in (("per-item", per_item_clear), ("bulk", bulk_clear)):
+            view, page = build_view(user_id)
+            start = time.perf_counter()
+            clear(view)
+            elapsed = time.perf_counter() - start
+            left = db.count_tasks(user_id, True)
+            print(f"{name:<9} {elapsed * 1000:>9.1f} ms  {page.updates:>6} updates  {left} completed rows left")
+
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flet as ft
+import db
+import app1
+
+RECURRENCES = 20
+HISTORY_DAYS = (0, 365, 3650)
+
+
+class FakePage:
+    def update(self, *controls):
+        pass
+
+
+def open_daily_view(user_id, day):
+    # What showing the daily view on a new day costs: scheduling the day,
+    # loading its instances and the streak summary
+    db.today = lambda: day
+    start = time.perf_counter()
+    page = FakePage()
+    view = app1.DailyTasksApp(page, ft.IconButton(icon=ft.Icons.MENU), None, user_id)
+    view._build_add_commands(index={"page": page})
+    return time.perf_counter() - start, view
+
+
+def main():
+    first_day = datetime.date(2020, 1, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+
+        for days in HISTORY_DAYS:
+            db.add_user(f'bench{days}', 'bench')
+            user_id = db.get_user(f'bench{days}')[0]
+            for i in range(RECURRENCES):
+                db.add_recurrence(user_id, f"habit {i}", day=first_day.isoformat())
+            # Every habit done every day: the longest possible streaks
+            for offset in range(1, days + 1):
+                db.schedule_day(user_id, (first_day + datetime.timedelta(days=offset)).isoformat())
+            with db.get_connection() as conn:
+                conn.execute("UPDATE tasks SET completed = 1 WHERE user_id = ?", (user_id,))
+
+            today = first_day + datetime.timedelta(days=days + 1)
+            first, _ = open_daily_view(user_id, today.isoformat())
+            with db.get_connection() as conn:
+                conn.execute("UPDATE tasks SET completed = 1 WHERE user_id = ?", (user_id,))
+            next_day, view = open_daily_view(user_id, (today + datetime.timedelta(days=1)).isoformat())
+            print(f"{days:>5} days of history  first open {first * 1000:>7.1f} ms  "
+                  f"next day {next_day * 1000:>6.1f} ms  ({len(view.tasks.controls)} tasks, {view.summary.value})")
+
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
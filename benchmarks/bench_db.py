@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+OPS = 2000
+
+
+def per_click_toggle(path, task_ids):
+    # What every handler used to do: connect, run one statement, commit, close
+    for i, task_id in enumerate(task_ids):
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE tasks SET completed = ? WHERE id = ?", (i % 2, task_id))
+        conn.commit()
+        conn.close()
+
+
+def pooled_toggle(path, task_ids):
+    # Long-lived connection, still one commit per click
+    conn = db.get_connection()
+    for i, task_id in enumerate(task_ids):
+        conn.execute("UPDATE tasks SET completed = ? WHERE id = ?", (i % 2, task_id))
+        conn.commit()
+
+
+def write_behind_toggle(path, task_ids):
+    for i, task_id in enumerate(task_ids):
+        db.update_task_completed(task_id, i % 2)
+    db.flush()
+
+
+def run(name, fn, path, task_ids):
+    start = time.perf_counter()
+    fn(path, task_ids)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(task_ids) / elapsed:>10.0f} ops/sec")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        db.add_user("bench", "bench")
+        user_id = db.get_user("bench")[0]
+        task_ids = [db.add_task(user_id, f"task {i}") for i in range(OPS)]
+
+        run("per-click", per_click_toggle, db.DB_PATH, task_ids)
+        run("pooled", pooled_toggle, db.DB_PATH, task_ids)
+        run("write-behind", write_behind_toggle, db.DB_PATH, task_ids)
+
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flet as ft
+import db
+import app1
+
+SIZES = [1_000, 10_000, 100_000]
+# The eager baseline takes minutes at 100k rows, so stop measuring it here
+EAGER_LIMIT = 10_000
+
+
+class FakePage:
+    def update(self, *controls):
+        pass
+
+
+def eager_view(user_id):
+    # The old behaviour: one Task control per row, all in a single Column
+    tasks = ft.Column()
+    for row in db.load_tasks(user_id):
+        tasks.controls.append(
+            app1.Task(row[1], lambda task: None, lambda task: None, task_id=row[0], completed=row[2])
+        )
+    return tasks
+
+
+def paged_view(user_id):
+    return app1.TodoApp(ft.IconButton(icon=ft.Icons.MENU), None, FakePage(), user_id)
+
+
+def first_paint(build, user_id):
+    # Building the view and serializing its control tree is what happens
+    # between page.add() and the client receiving the first frame.
+    start = time.perf_counter()
+    view = build(user_id)
+    commands = view._build_add_commands(index={"page": FakePage()})
+    return time.perf_counter() - start, len(commands)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        db.add_user('bench', 'bench')
+        user_id = db.get_user('bench')[0]
+        conn = db.get_connection()
+
+        loaded = 0
+        for size in SIZES:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO tasks (task_name, completed, user_id) VALUES (?, ?, ?)",
+                    ((f"task {i}", i % 3 == 0, user_id) for i in range(loaded, size))
+                )
+            loaded = size
+
+            for name, build in (("eager", eager_view), ("paged", paged_view)):
+                if build is eager_view and size > EAGER_LIMIT:
+                    continue
+                elapsed, controls = first_paint(build, user_id)
+                print(f"{size:>7} tasks  {name:<6} {elapsed * 1000:>9.1f} ms  {controls:>8} controls")
+
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
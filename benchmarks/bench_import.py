@@ -0,0 +1,57 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import transfer
+
+ROWS = 50_000
+
+
+def jsonl_file():
+    return io.StringIO("".join(
+        json.dumps({"task_name": f"imported task {i}", "completed": i % 3 == 0}) + "\n" for i in range(ROWS)
+    ))
+
+
+def per_row(user_id, file):
+    # What importing through add_clicked would cost: one INSERT + commit each
+    count = 0
+    for task_name, completed in transfer.task_rows(transfer.read_jsonl(file)):
+        db.add_task(user_id, task_name, completed)
+        count += 1
+    return count
+
+
+def batched(user_id, file):
+    return transfer.import_tasks(user_id, file, "jsonl")
+
+
+def export(user_id, file):
+    return transfer.export_tasks(user_id, io.StringIO(), "csv")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        for name, run in (("per-row", per_row), ("batched", batched), ("export", export)):
+            db.add_user(name, name)
+            user_id = db.get_user(name)[0]
+            if name == "export":
+                transfer.import_tasks(user_id, jsonl_file(), "jsonl")
+            file = jsonl_file()
+            start = time.perf_counter()
+            count = run(user_id, file)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<8} {count:>7} rows  {elapsed:>7.2f} s  {count / elapsed:>10,.0f} rows/s")
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
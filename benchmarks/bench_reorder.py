@@ -0,0 +1,60 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+TASKS = 100_000
+MOVES = 200
+
+
+def renumber_move(user_id, task_id, before_id):
+    # The alternative without fractional positions: rewrite every row's
+    # index after the move
+    conn = db.get_connection()
+    ids = [row[0] for row in conn.execute(
+        "SELECT id FROM tasks WHERE user_id = ? AND due_date IS NULL ORDER BY position, id", (user_id,)
+    )]
+    ids.remove(task_id)
+    ids.insert(ids.index(before_id) + 1 if before_id is not None else 0, task_id)
+    with conn:
+        conn.executemany("UPDATE tasks SET position = ? WHERE id = ?", ((i, task_id) for i, task_id in enumerate(ids)))
+
+
+def fractional_move(user_id, task_id, before_id):
+    db.move_task(task_id, before_id)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        db.add_user('bench', 'bench')
+        user_id = db.get_user('bench')[0]
+        db.add_tasks(user_id, ((f"task {i}", False) for i in range(TASKS)))
+        conn = db.get_connection()
+
+        for name, move, moves in (("renumber", renumber_move, MOVES // 20), ("fractional", fractional_move, MOVES)):
+            rng = random.Random(0)
+            changes = conn.total_changes
+            start = time.perf_counter()
+            for _ in range(moves):
+                task_id = rng.randint(1, TASKS)
+                before_id = rng.choice([None, rng.randint(1, TASKS)])
+                if before_id == task_id:
+                    continue
+                move(user_id, task_id, before_id)
+            db.flush()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<10} {elapsed / moves * 1000:>9.2f} ms/move  "
+                  f"{(conn.total_changes - changes) / moves:>9.0f} rows written/move")
+
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
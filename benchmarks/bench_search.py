@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+ROWS = 1_000_000
+REPEAT = 5
+
+WORDS = [f"word{i}" for i in range(5000)]
+# common, rare, two words and one that never appears
+QUERIES = ["word7", "word300", "word7 word12", "nosuchword"]
+
+
+def task_names(rng):
+    for _ in range(ROWS):
+        # Skewed so low-numbered words are common and high-numbered ones rare
+        yield " ".join(WORDS[int(rng.paretovariate(1.0)) % len(WORDS)] for _ in range(4))
+
+
+def like_search(user_id, text, limit):
+    # What a search box would do without an index: scan every task
+    clauses = " AND ".join("task_name LIKE ?" for _ in text.split())
+    cursor = db.get_connection().execute(
+        f"SELECT id, task_name, completed FROM tasks WHERE user_id = ? AND {clauses} ORDER BY id LIMIT ?",
+        (user_id, *(f"%{word}%" for word in text.split()), limit)
+    )
+    return cursor.fetchall()
+
+
+def fts_search(user_id, text, limit):
+    return db.search_tasks(user_id, text, limit=limit)
+
+
+def timed(search, user_id, text):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        rows = search(user_id, text, 50)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(rows)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        db.add_user('bench', 'bench')
+        user_id = db.get_user('bench')[0]
+
+        start = time.perf_counter()
+        rng = random.Random(0)
+        with db.get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO tasks (task_name, completed, user_id, goal) VALUES (?, 0, ?, ?)",
+                ((name, user_id, db.normalize_goal(name)) for name in task_names(rng))
+            )
+        print(f"inserted {ROWS} rows (with search index) in {time.perf_counter() - start:.1f} s")
+
+        for text in QUERIES:
+            like_time, like_rows = timed(like_search, user_id, text)
+            fts_time, fts_rows = timed(fts_search, user_id, text)
+            print(f"{text!r:<20} LIKE {like_time * 1000:>8.1f} ms ({like_rows:>2} rows)  "
+                  f"FTS5 {fts_time * 1000:>6.1f} ms ({fts_rows:>2} rows)")
+
+        db.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNS = 5
+TOP_IMPORTS = 8
+# Only needed once a plan is requested; none of these should load at startup
+LAZY_MODULES = ("openai", "pydantic", "dotenv")
+
+# Runs in a fresh interpreter: import the app, build the login screen on a
+# fake page and serialize it, then print the wall clock time it was ready.
+CHILD = f"""
+import sys, time
+sys.path.insert(0, {ROOT!r})
+import app1
+
+class FakePage:
+    def __init__(self):
+        self.controls = []
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+
+    def update(self, *controls):
+        pass
+
+page = FakePage()
+app1.main(page)
+page.controls[0]._build_add_commands(index={{"page": page}})
+print(time.time())
+print(" ".join(sorted(sys.modules)))
+"""
+
+
+def run_child(*flags):
+    # Run in an empty directory so a tasks.db appearing there means the
+    # database was touched before anyone logged in
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.time()
+        result = subprocess.run(
+            [sys.executable, *flags, "-c", CHILD], cwd=tmp, capture_output=True, text=True, check=True
+        )
+        ready, modules = result.stdout.splitlines()[-2:]
+        db_created = os.path.exists(os.path.join(tmp, "tasks.db"))
+    return float(ready) - start, set(modules.split()), db_created, result.stderr
+
+
+def app_imports(stderr):
+    # Returns app1's cumulative import time and its direct imports. Lines are
+    # "import time: self [us] | cumulative | imported package", indented two
+    # spaces per nesting level, and a module's imports come before it.
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "app1":
+                return int(cumulative), sorted(children, reverse=True)
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    raise ValueError("app1 not found in -X importtime output")
+
+
+def main():
+    times = []
+    for _ in range(RUNS):
+        elapsed, modules, db_created, _ = run_child()
+        times.append(elapsed)
+    print(f"time to login screen  median {statistics.median(times) * 1000:.0f} ms  "
+          f"min {min(times) * 1000:.0f} ms  ({RUNS} runs, includes interpreter start)")
+    print(f"{'/'.join(LAZY_MODULES)} loaded at startup: "
+          f"{', '.join(m for m in LAZY_MODULES if m in modules) or 'none'}")
+    print(f"tasks.db opened before login: {'yes' if db_created else 'no'}")
+
+    _, _, _, stderr = run_child("-X", "importtime")
+    total, children = app_imports(stderr)
+    print(f"\nimport app1: {total / 1000:.0f} ms cumulative (-X importtime)")
+    for cumulative, name in children[:TOP_IMPORTS]:
+        print(f"  {name:<24} {cumulative / 1000:>7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
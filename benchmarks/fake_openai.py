@@ -0,0 +1,240 @@
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A stand-in for the parts of the OpenAI API the app uses: chat completions
+# (plain and streamed), file upload/download and batches. Run it and point
+# the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+PLAN_WORDS = 120
+
+
+def fake_plan(goal):
+    steps = " ".join(f"step{i}" for i in range(PLAN_WORDS))
+    return f"Goal: {goal}\nPlan: {steps}"
+
+
+def usage(plan):
+    completion_tokens = len(plan.split())
+    return {"prompt_tokens": 80, "completion_tokens": completion_tokens, "total_tokens": 80 + completion_tokens}
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, batch_latency=0.0, requests_per_minute=500, tokens_per_minute=200000):
+        super().__init__(address, Handler)
+        # latency: seconds per chat completion; batch_latency: seconds
+        # before a submitted batch is reported as completed
+        self.latency = latency
+        self.batch_latency = batch_latency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.recent = deque()  # (timestamp, tokens) of chat completions in the last minute
+        self.ids = itertools.count(1)
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.chat_requests = 0
+        self.batch_requests = 0
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def new_id(self, prefix):
+        return f"{prefix}-{next(self.ids)}"
+
+    def complete(self, body):
+        time.sleep(self.latency)
+        plan = fake_plan(body["messages"][-1]["content"])
+        return {
+            "id": self.new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": plan},
+                "finish_reason": "stop",
+            }],
+            "usage": usage(plan),
+        }
+
+    def rate_limit_headers(self, tokens):
+        with self.lock:
+            now = time.time()
+            self.recent.append((now, tokens))
+            while self.recent[0][0] < now - 60:
+                self.recent.popleft()
+            used_tokens = sum(tokens for _, tokens in self.recent)
+            return {
+                "x-ratelimit-limit-requests": str(self.requests_per_minute),
+                "x-ratelimit-remaining-requests": str(max(0, self.requests_per_minute - len(self.recent))),
+                "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+                "x-ratelimit-remaining-tokens": str(max(0, self.tokens_per_minute - used_tokens)),
+            }
+
+    def run_batch(self, batch_id):
+        time.sleep(self.batch_latency)
+        batch = self.batches[batch_id]
+        output = []
+        for line in self.files[batch["input_file_id"]]["content"].decode().splitlines():
+            request = json.loads(line)
+            plan = fake_plan(request["body"]["messages"][-1]["content"])
+            output.append(json.dumps({
+                "id": self.new_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {
+                        "object": "chat.completion",
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": plan}}],
+                        "usage": usage(plan),
+                    },
+                },
+            }))
+        output_file = self.add_file("batch_output.jsonl", "\n".join(output).encode(), "batch_output")
+        with self.lock:
+            batch["status"] = "completed"
+            batch["output_file_id"] = output_file["id"]
+            batch["completed_at"] = int(time.time())
+            batch["request_counts"] = {"total": len(output), "completed": len(output), "failed": 0}
+
+    def add_file(self, filename, content, purpose):
+        file_object = {
+            "id": self.new_id("file"),
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self.lock:
+            self.files[file_object["id"]] = dict(file_object, content=content)
+        return file_object
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send(self, status, payload, content_type="application/json", headers=None):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client cancelled the request
+
+    def do_POST(self):
+        server = self.server
+        if self.path == "/v1/chat/completions":
+            body = json.loads(self.read_body())
+            with server.lock:
+                server.chat_requests += 1
+            completion = server.complete(body)
+            headers = server.rate_limit_headers(completion["usage"]["total_tokens"])
+            if body.get("stream"):
+                include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+                self.send(200, self.as_stream(completion, include_usage), "text/event-stream", headers)
+            else:
+                self.send(200, completion, headers=headers)
+        elif self.path == "/v1/files":
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + self.read_body()
+            )
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            upload = fields["file"]
+            purpose = fields["purpose"].get_content()
+            self.send(200, server.add_file(upload.get_filename(), upload.get_payload(decode=True), purpose))
+        elif self.path == "/v1/batches":
+            body = json.loads(self.read_body())
+            batch = {
+                "id": server.new_id("batch"),
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"],
+                "status": "in_progress",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+            }
+            with server.lock:
+                server.batches[batch["id"]] = batch
+                server.batch_requests += 1
+            threading.Thread(target=server.run_batch, args=(batch["id"],), daemon=True).start()
+            self.send(200, batch)
+        else:
+            self.send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_GET(self):
+        server = self.server
+        batch = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+        content = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+        if batch and batch.group(1) in server.batches:
+            with server.lock:
+                self.send(200, dict(server.batches[batch.group(1)]))
+        elif content and content.group(1) in server.files:
+            self.send(200, server.files[content.group(1)]["content"], "application/octet-stream")
+        else:
+            self.send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def as_stream(self, completion, include_usage=False):
+        events = []
+        for word in completion["choices"][0]["message"]["content"].split(" "):
+            chunk = {
+                "id": completion["id"],
+                "object": "chat.completion.chunk",
+                "created": completion["created"],
+                "model": completion["model"],
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            events.append(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+        if include_usage:
+            chunk = {
+                "id": completion["id"],
+                "object": "chat.completion.chunk",
+                "created": completion["created"],
+                "model": completion["model"],
+                "choices": [],
+                "usage": completion["usage"],
+            }
+            events.append(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+        events.append(b"data: [DONE]\n\n")
+        return b"".join(events)
+
+
+def start(port=0, latency=0.0, batch_latency=0.0):
+    server = FakeOpenAI(("127.0.0.1", port), latency, batch_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per chat completion")
+    parser.add_argument("--batch-latency", type=float, default=2.0, help="seconds until a batch completes")
+    args = parser.parse_args()
+    server = FakeOpenAI(("127.0.0.1", args.port), args.latency, args.batch_latency)
+    print(f"Serving on {server.base_url}")
+    server.serve_forever()
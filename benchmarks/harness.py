@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import flet as ft
+from flet.core.local_connection import LocalConnection
+from flet.core.protocol import (
+    ClientActions, ClientMessage, CommandEncoder, PageCommandResponsePayload, PageCommandsBatchResponsePayload
+)
+from flet.core.pubsub.pubsub_hub import PubSubHub
+import db
+import app1
+
+# Drives the real views through a real ft.Page with no Flet client: the page
+# diffs and serializes every update exactly as it would for a browser, and
+# HeadlessConnection measures the messages instead of sending them.
+#
+#   python benchmarks/harness.py [--tasks N] [--repeat R] [--json results.json]
+
+TASKS = 10_000
+REPEAT = 30
+LOGIN_USERS = 20
+PERCENTILES = (50, 95, 99)
+
+
+class HeadlessConnection(LocalConnection):
+    # What flet's socket server does with a page's commands, minus the socket
+    def __init__(self, loop):
+        super().__init__()
+        self.pubsubhub = PubSubHub(loop)
+        self.messages = 0
+        self.bytes_sent = 0
+
+    def send_command(self, session_id, command):
+        result, message = self._process_command(command)
+        if message:
+            self.send(message)
+        return PageCommandResponsePayload(result=result, error="")
+
+    def send_commands(self, session_id, commands):
+        results = []
+        messages = []
+        for command in commands:
+            result, message = self._process_command(command)
+            if command.name in ("add", "get"):
+                results.append(result)
+            if message:
+                messages.append(message)
+        if messages:
+            self.send(ClientMessage(ClientActions.PAGE_CONTROLS_BATCH, messages))
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+    def send(self, message):
+        self.messages += 1
+        self.bytes_sent += len(json.dumps(message, cls=CommandEncoder, separators=(",", ":")))
+
+
+class SqlCounter:
+    # Statements SQLite runs internally (for triggers and FTS5) are counted
+    # separately; see db.statement_kind
+    def __init__(self):
+        self.statements = 0
+        self.internal = 0
+
+    def __call__(self, sql, kind):
+        if kind == "internal":
+            self.internal += 1
+        elif kind is not None:
+            self.statements += 1
+
+
+class Session:
+    # One browser tab: a page running app1.main
+    def __init__(self, harness):
+        self.harness = harness
+        self.session_id = f"session{next(harness.session_ids)}"
+        self.page = ft.Page(harness.conn, self.session_id, harness.loop)
+        harness.conn.sessions[self.session_id] = self.page
+        app1.main(self.page)
+
+    def login(self, username, password="bench"):
+        login = self.page.controls[0]
+        login.username.value = username
+        login.password.value = password
+        login.submit_clicked(None)
+
+    def show_view(self, index):
+        self.drawer.selected_index = index
+        self.drawer.on_change(None)
+
+    @property
+    def drawer(self):
+        return self.page.controls[0].drawer
+
+    @property
+    def todo(self):
+        return next(view for view in self.page.controls if isinstance(view, app1.TodoApp))
+
+    @property
+    def daily(self):
+        return next(view for view in self.page.controls if isinstance(view, app1.DailyTasksApp))
+
+    def controls(self):
+        # Controls currently mounted on the page
+        return len(self.page.index)
+
+    def close(self):
+        self.page._close()
+        self.harness.conn.sessions.pop(self.session_id, None)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Harness:
+    def __init__(self, repeat=REPEAT):
+        self.repeat = repeat
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="harness-loop", daemon=True).start()
+        self.conn = HeadlessConnection(self.loop)
+        self.session_ids = itertools.count(1)
+        self.sql = SqlCounter()
+        db.add_trace_callback(self.sql)
+        self.results = []
+
+    def counters(self):
+        return self.sql.statements, self.sql.internal, self.conn.messages, self.conn.bytes_sent
+
+    def run(self, action, *args):
+        # Runs action(*args) once and returns its sample (seconds, statements,
+        # internal statements, messages, bytes) and its result. Writes the
+        # action queued are flushed after it, so they count towards it but
+        # not towards its latency.
+        db.flush()
+        before = self.counters()
+        start = time.perf_counter()
+        result = action(*args)
+        elapsed = time.perf_counter() - start
+        db.flush()
+        return (elapsed, *(after - count for after, count in zip(self.counters(), before))), result
+
+    def measure(self, name, action, setup=None, session=None):
+        # Runs setup(i) untimed, then action(i, <what setup returned>), `repeat` times
+        samples = []
+        controls = None
+        for i in range(self.repeat):
+            context = setup(i) if setup else None
+            sample, result = self.run(action, i, context)
+            samples.append(sample)
+            # A session the action opened is measured, then closed
+            if isinstance(result, Session):
+                controls = result.controls()
+                result.close()
+        if session is not None:
+            controls = session.controls()
+        return self.summarize(name, samples, controls)
+
+    def summarize(self, name, samples, controls=None):
+        latencies = [sample[0] for sample in samples]
+        runs = len(samples)
+        result = {
+            "name": name,
+            "runs": runs,
+            **{f"p{p}_ms": percentile(latencies, p) * 1000 for p in PERCENTILES},
+            "max_ms": max(latencies) * 1000,
+            "sql_per_op": sum(sample[1] for sample in samples) / runs,
+            "internal_sql_per_op": sum(sample[2] for sample in samples) / runs,
+            "messages_per_op": sum(sample[3] for sample in samples) / runs,
+            "bytes_per_op": sum(sample[4] for sample in samples) / runs,
+            "controls": controls,
+        }
+        self.results.append(result)
+        return result
+
+    def close(self):
+        db.remove_trace_callback(self.sql)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def seed(tasks):
+    db.add_user("bench", "bench")
+    user_id = db.get_user("bench")[0]
+    # Every third task done, so every filter tab has something to show
+    db.add_tasks(user_id, ((f"task {i} for the benchmark", i % 3 == 0) for i in range(tasks)))
+    for i in range(LOGIN_USERS):
+        db.add_user(f"user{i}", "bench")
+        db.add_tasks(db.get_user(f"user{i}")[0], ((f"task {j}", False) for j in range(10)))
+
+
+def run_workloads(harness, tasks):
+    def login(i, _):
+        session = Session(harness)
+        session.login(f"user{i % LOGIN_USERS}")
+        return session
+
+    harness.measure("login storm", login)
+
+    def open_todo(i, _):
+        session = Session(harness)
+        session.login("bench")
+        return session
+
+    harness.measure(f"open to-do ({tasks} tasks)", open_todo)
+
+    session = Session(harness)
+    session.login("bench")
+    todo = session.todo
+
+    def add(i, _):
+        todo.new_task.value = f"added {i}"
+        todo.add_clicked(None)
+
+    harness.measure("add task", add, session=session)
+
+    def toggle(i, _):
+        task = todo.tasks.controls[i % len(todo.tasks.controls)]
+        task.display_task.value = not task.completed
+        task.status_changed(None)
+
+    harness.measure("toggle task", toggle, session=session)
+
+    def switch_tab(i, _):
+        todo.filter.selected_index = (i + 1) % len(todo.filter.tabs)
+        todo.tabs_changed(None)
+
+    harness.measure("switch filter tab", switch_tab, session=session)
+    todo.filter.selected_index = 0
+    todo.tabs_changed(None)
+
+    def scroll(i, _):
+        todo.tasks.scrolled(types.SimpleNamespace(pixels=1, max_scroll_extent=0))
+
+    harness.measure("scroll to load more", scroll, session=session)
+
+    queries = ["task 1", "benchmark", "task 12 for", "nosuchword"]
+
+    def search(i, _):
+        todo.search.value = queries[i % len(queries)]
+        todo.search_changed(None)
+
+    harness.measure("search", search, session=session)
+    todo.search.value = ""
+    todo.search_changed(None)
+
+    def complete_some(i):
+        # Clearing doesn't page more tasks in; scroll for them like a user would
+        while sum(not task.completed for task in todo.tasks.controls) < 5 and not todo.tasks.exhausted:
+            todo.tasks.load_more()
+        for task in [task for task in todo.tasks.controls if not task.completed][:5]:
+            task.display_task.value = True
+            task.status_changed(None)
+
+    def clear(i, _):
+        todo.clear_clicked(None)
+
+    harness.measure("clear completed", clear, setup=complete_some, session=session)
+
+    def logged_in(i):
+        daily_session = Session(harness)
+        daily_session.login(f"user{i % LOGIN_USERS}")
+        return daily_session
+
+    def open_daily(i, daily_session):
+        daily_session.show_view(1)
+        return daily_session
+
+    harness.measure("open daily view", open_daily, setup=logged_in)
+
+    session.show_view(1)
+    daily = session.daily
+
+    def add_daily(i, _):
+        daily.new_task.value = f"habit {i}"
+        daily.add_clicked(None)
+
+    harness.measure("add daily task", add_daily, session=session)
+    session.close()
+
+
+def print_results(results):
+    print(f"{'operation':<28} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  {'sql':>6} {'internal':>8} "
+          f"{'msgs':>5} {'bytes':>8} {'controls':>8}")
+    for r in results:
+        print(f"{r['name']:<28} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}  "
+              f"{r['sql_per_op']:>6.1f} {r['internal_sql_per_op']:>8.1f} {r['messages_per_op']:>5.1f} "
+              f"{r['bytes_per_op']:>8.0f} {r['controls'] if r['controls'] is not None else '':>8}")
+    print("latencies in ms; sql, internal, msgs and bytes are per operation; controls mounted afterwards")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the views headlessly against a temporary tasks.db")
+    parser.add_argument("--tasks", type=int, default=TASKS, help="tasks of the user whose list is benchmarked")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs of each operation")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        seed(args.tasks)
+        harness = Harness(args.repeat)
+        try:
+            run_workloads(harness, args.tasks)
+        finally:
+            harness.close()
+            db.close_all()
+
+    print_results(harness.results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(harness.results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import app1
+import fake_openai
+import harness
+
+# Drives the app with a trace recorded with TASKS_TRACE_FILE set (see
+# recorder.py) and reports the same numbers as harness.py per handler.
+#
+#   python benchmarks/replay.py traces.jsonl [--db tasks.db] [--speed 1] [--json results.json]
+#
+# Replay into a copy of the database as it was when recording started to get
+# the same task ids; into any other database tasks are found by name. Users
+# the trace logs in as are created if missing, since passwords are not
+# recorded. Events of all sessions replay in recorded order on one thread.
+
+REPLAY_PASSWORD = "replay"
+
+
+def read_trace(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def view(session, name):
+    views = [control for control in session.page.controls
+             if isinstance(control, app1.TodoApp if name == "todo" else app1.DailyTasksApp)]
+    return views[0] if views else None
+
+
+def find_task(session, state):
+    task_view = view(session, "todo" if state["due_date"] is None else "daily")
+    if task_view is None:
+        return None
+    tasks = task_view.tasks.controls
+    return next((task for task in tasks if task.task_id == state["task_id"]), None) or \
+        next((task for task in tasks if task.task_name == state["task_name"]), None)
+
+
+def login_page(session):
+    page = session.page.controls[0] if session.page.controls else None
+    return page if isinstance(page, app1.LoginPage) else None
+
+
+# Each replays one handler: it puts back the state the handler reads and
+# returns the call to time, or None if the event can't be replayed (the
+# control it was on isn't there). Setting state up is not timed.
+
+def replay_submit(session, state):
+    login = login_page(session)
+    if login is None:
+        return None
+    user = db.get_user(state["username"])
+    if user is None and not state["registering"]:
+        db.add_user(state["username"], REPLAY_PASSWORD)
+        user = db.get_user(state["username"])
+    login.username.value = state["username"]
+    login.password.value = user[1] if user else REPLAY_PASSWORD
+    login.is_registering = state["registering"]
+    return lambda: login.submit_clicked(None)
+
+
+def replay_switch_to_register(session, state):
+    login = login_page(session)
+    if login is None:
+        return None
+    return lambda: login.switch_to_register(None)
+
+
+def replay_drawer(session, state):
+    if login_page(session) is not None:
+        return None
+    session.drawer.selected_index = state["index"]
+    return lambda: session.drawer.on_change(None)
+
+
+def task_replayer(prepare=None, method=None):
+    def replay(session, state):
+        task = find_task(session, state)
+        if task is None:
+            return None
+        if prepare:
+            prepare(task, state)
+        return lambda: getattr(task, method)(None)
+    return replay
+
+
+def set_completed(task, state):
+    task.display_task.value = state["completed"]
+
+
+def set_new_name(task, state):
+    if task.edit_name is None:
+        task.edit_clicked(None)
+    task.edit_name.value = state["new_name"]
+
+
+def list_replayer(method, event):
+    def replay(session, state):
+        task_view = view(session, state["view"])
+        if task_view is None:
+            return None
+        if method == "reordered" and max(state["old_index"], state["new_index"]) >= len(task_view.tasks.controls):
+            return None
+        return lambda: getattr(task_view.tasks, method)(types.SimpleNamespace(**event(state)))
+    return replay
+
+
+def todo_replayer(prepare=None, method=None):
+    def replay(session, state):
+        todo = view(session, "todo")
+        if todo is None:
+            return None
+        if prepare:
+            prepare(todo, state)
+        return lambda: getattr(todo, method)(None)
+    return replay
+
+
+def set_tab(todo, state):
+    todo.filter.selected_index = state["index"]
+
+
+def set_query(todo, state):
+    todo.search.value = state["query"]
+
+
+def set_new_task(todo, state):
+    todo.new_task.value = state["task_name"]
+
+
+def replay_daily_add(session, state):
+    daily = view(session, "daily")
+    if daily is None:
+        return None
+    daily.new_task.value = state["task_name"]
+    for day, checkbox in enumerate(daily.weekdays):
+        checkbox.value = bool(state["weekdays"] & (1 << day))
+    return lambda: daily.add_clicked(None)
+
+
+REPLAY = {
+    "LoginPage.submit_clicked": replay_submit,
+    "LoginPage.switch_to_register": replay_switch_to_register,
+    "main.on_drawer_index_change": replay_drawer,
+    "Task.edit_clicked": task_replayer(method="edit_clicked"),
+    "Task.save_clicked": task_replayer(set_new_name, "save_clicked"),
+    "Task.status_changed": task_replayer(set_completed, "status_changed"),
+    "Task.delete_clicked": task_replayer(method="delete_clicked"),
+    "Task.create_plan": task_replayer(method="create_plan"),
+    "Task.cancel_plan": task_replayer(method="cancel_plan"),
+    "TaskList.reordered": list_replayer(
+        "reordered", lambda state: {"old_index": state["old_index"], "new_index": state["new_index"]}
+    ),
+    "TaskList.scrolled": list_replayer(
+        "scrolled", lambda state: {"pixels": state["pixels"], "max_scroll_extent": state["max_scroll_extent"]}
+    ),
+    "TodoApp.add_clicked": todo_replayer(set_new_task, "add_clicked"),
+    "TodoApp.search_changed": todo_replayer(set_query, "search_changed"),
+    "TodoApp.tabs_changed": todo_replayer(set_tab, "tabs_changed"),
+    "TodoApp.clear_clicked": todo_replayer(method="clear_clicked"),
+    "TodoApp.plan_all_clicked": todo_replayer(method="plan_all_clicked"),
+    "DailyTasksApp.add_clicked": replay_daily_add,
+}
+
+
+def replay(bench, records, speed):
+    # speed 1 keeps the recorded gaps between events, 2 halves them, 0 replays
+    # as fast as possible. Returns {handler: [samples]} and how many events
+    # were skipped.
+    sessions = {}
+    samples = {}
+    skipped = 0
+    start = time.perf_counter()
+    for record in records:
+        if speed:
+            delay = (record["time"] - records[0]["time"]) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if record["session"] not in sessions:
+            sessions[record["session"]] = harness.Session(bench)
+        replayer = REPLAY.get(record["handler"])
+        # Records whose state couldn't be captured have an error instead
+        call = replayer(sessions[record["session"]], record["state"]) if replayer and "state" in record else None
+        if call is None:
+            skipped += 1
+            continue
+        sample, _ = bench.run(call)
+        samples.setdefault(record["handler"], []).append(sample)
+    controls = sum(session.controls() for session in sessions.values())
+    for session in sessions.values():
+        session.close()
+    return samples, skipped, controls
+
+
+def copy_database(source, target):
+    # The backup API copies a consistent snapshot, WAL included
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded UI event trace and measure each handler")
+    parser.add_argument("trace", help="JSONL file recorded with TASKS_TRACE_FILE")
+    parser.add_argument("--db", help="database to replay into (a copy is used); empty if not given")
+    parser.add_argument("--speed", type=float, default=0, help="1 for recorded timing, 0 for max speed (default)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    records = read_trace(args.trace)
+    if not records:
+        parser.error(f"no events in {args.trace}")
+
+    # Plans are made by the local stand-in, not the real API
+    server = fake_openai.start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "replay.db")
+        if args.db:
+            copy_database(args.db, db.DB_PATH)
+        bench = harness.Harness()
+        try:
+            samples, skipped, controls = replay(bench, records, args.speed)
+        finally:
+            bench.close()
+            db.close_all()
+    server.shutdown()
+
+    for handler_name, handler_samples in samples.items():
+        bench.summarize(handler_name, handler_samples)
+    harness.print_results(bench.results)
+    print(f"{len(records)} events, {skipped} skipped; {controls} controls mounted at the end")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(bench.results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
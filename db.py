@@ -0,0 +1,679 @@
+import atexit
+import datetime
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import migrations
+
+DB_PATH = 'tasks.db'
+
+JOURNAL_MODE = os.environ.get('TASKS_DB_JOURNAL_MODE', 'WAL')
+SYNCHRONOUS = os.environ.get('TASKS_DB_SYNCHRONOUS', 'NORMAL')
+CACHE_SIZE = int(os.environ.get('TASKS_DB_CACHE_SIZE', '-8000'))  # negative means KiB
+MMAP_SIZE = int(os.environ.get('TASKS_DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+
+# Write-behind queue: UI mutations are flushed in one transaction every
+# FLUSH_INTERVAL_MS or as soon as FLUSH_MAX_OPS statements are pending.
+FLUSH_INTERVAL_MS = int(os.environ.get('TASKS_DB_FLUSH_INTERVAL_MS', '50'))
+FLUSH_MAX_OPS = int(os.environ.get('TASKS_DB_FLUSH_MAX_OPS', '500'))
+# A batch that fails (say the database stays locked past the busy timeout)
+# is queued again and retried, waiting twice as long each time up to this.
+FLUSH_RETRY_MAX_MS = int(os.environ.get('TASKS_DB_FLUSH_RETRY_MAX_MS', '5000'))
+
+# Generated plans are cached in the plans table; entries expire after
+# PLAN_CACHE_TTL seconds and the least recently used ones are evicted
+# beyond PLAN_CACHE_MAX_ENTRIES.
+PLAN_CACHE_TTL = int(os.environ.get('PLAN_CACHE_TTL', str(30 * 24 * 3600)))
+PLAN_CACHE_MAX_ENTRIES = int(os.environ.get('PLAN_CACHE_MAX_ENTRIES', '10000'))
+
+# Tasks are ordered by a REAL position: new tasks go after the last one and
+# a moved task gets the midpoint of its new neighbours, so a move writes
+# one row. Once neighbours are closer than REBALANCE_GAP the list is
+# renumbered 1, 2, 3, ... in the background.
+REBALANCE_GAP = 1e-6
+
+# Search ranks matches with bm25; a hit in the task name counts this many
+# times as much as a hit in its plan. Scoring every match of a very common
+# word is what makes FTS slow, so matches are ranked SEARCH_MAX_CANDIDATES
+# at a time, newest first (see search_tasks).
+SEARCH_NAME_WEIGHT = 10.0
+SEARCH_MAX_CANDIDATES = int(os.environ.get('TASKS_SEARCH_MAX_CANDIDATES', '2000'))
+
+# Each thread keeps one long-lived connection; sqlite3 reuses prepared
+# statements per connection through its statement cache.
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_pool = []
+_pool_lock = threading.Lock()
+# Bumped by close_all, so every thread, not just the one that called it,
+# opens a new connection next time
+_generation = 0
+
+# The schema is migrated (see migrations.py) by the first get_connection()
+# rather than at import, so starting the app does no database work before the
+# login screen.
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+# Trace callbacks, see add_trace_callback
+_trace_callbacks = []
+_last_statement = threading.local()
+
+
+def get_connection():
+    if not _schema_ready:
+        init_db()
+    return thread_connection()
+
+
+def thread_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.generation != _generation:
+        conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+        conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = {CACHE_SIZE}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.set_trace_callback(trace_statement if _trace_callbacks else None)
+        with _pool_lock:
+            _pool.append(conn)
+            _local.conn, _local.generation = conn, _generation
+    return conn
+
+
+def close_all():
+    global _schema_ready, _generation
+    writer.flush()
+    with _pool_lock:
+        for conn in _pool:
+            conn.close()
+        _pool.clear()
+        _generation += 1
+    _local.__dict__.clear()
+    # The next connection may be to a different DB_PATH
+    _schema_ready = False
+
+
+# callback(sql, kind) is called for every statement any pooled connection
+# runs, with kind from statement_kind. Connections only trace while a
+# callback is added. Both rebind the list, like hooks.add_hook.
+def add_trace_callback(callback):
+    global _trace_callbacks
+    with _pool_lock:
+        _trace_callbacks = [*_trace_callbacks, callback]
+        apply_tracing()
+
+
+def remove_trace_callback(callback):
+    global _trace_callbacks
+    with _pool_lock:
+        _trace_callbacks = [other for other in _trace_callbacks if other is not callback]
+        apply_tracing()
+
+
+def apply_tracing():
+    for conn in _pool:
+        conn.set_trace_callback(trace_statement if _trace_callbacks else None)
+
+
+# Only these can fire triggers
+TRIGGERING_KINDS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def statement_kind(sql):
+    # The statement's first keyword; "internal" for the statements SQLite
+    # runs itself for triggers and FTS5, which are traced starting with
+    # "--"; None when SQLite reports a write again for each trigger it
+    # fires, with the same text as before. The traced text has the
+    # parameter values filled in, so only a write run twice in a row with
+    # the same values is taken for such a repeat.
+    if sql.startswith("--"):
+        return "internal"
+    last, _last_statement.sql = getattr(_last_statement, "sql", None), sql
+    kind = sql.split(None, 1)[0].upper() if sql.strip() else "EMPTY"
+    if sql == last and kind in TRIGGERING_KINDS:
+        return None
+    return kind
+
+
+def trace_statement(sql):
+    kind = statement_kind(sql)
+    for callback in _trace_callbacks:
+        callback(sql, kind)
+
+
+class WriteBehindQueue:
+    def __init__(self, flush_interval_ms=FLUSH_INTERVAL_MS, max_ops=FLUSH_MAX_OPS):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_ops = max_ops
+        # (kind, task_id) -> (sql, params); a later write to the same row
+        # replaces the earlier one, so repeated toggles cost one statement.
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._full = threading.Event()
+        self._thread = None
+
+    def submit(self, kind, task_id, sql, params):
+        with self._lock:
+            self._put((kind, task_id), (sql, params))
+            if len(self._pending) >= self.max_ops:
+                self._full.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='tasks-db-writer', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _put(self, key, op):
+        kind, task_id = key
+        if kind == 'delete':
+            self._pending.pop(('name', task_id), None)
+            self._pending.pop(('completed', task_id), None)
+        self._pending[key] = op
+
+    def _requeue(self, failed):
+        # Puts a failed batch back in front of what was queued since, so
+        # newer writes to the same row still win
+        with self._lock:
+            newer, self._pending = self._pending, dict(failed)
+            for key, op in newer.items():
+                self._put(key, op)
+
+    def flush(self):
+        # Raises if the batch can't be written; it stays queued
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                conn = get_connection()
+                with conn:
+                    for sql, params in pending.values():
+                        conn.execute(sql, params)
+            except BaseException:
+                self._requeue(pending)
+                raise
+
+    def _run(self):
+        retry_delay = None
+        while True:
+            if retry_delay is None:
+                self._wake.wait()
+                self._full.wait(self.flush_interval)
+            else:
+                time.sleep(retry_delay)
+            self._wake.clear()
+            self._full.clear()
+            try:
+                self.flush()
+                retry_delay = None
+            except Exception as ex:
+                retry_delay = min((retry_delay or self.flush_interval) * 2, FLUSH_RETRY_MAX_MS / 1000)
+                print(f"Error while writing tasks, retrying in {retry_delay:.2f} s: {ex!r}", file=sys.stderr)
+
+
+writer = WriteBehindQueue()
+atexit.register(writer.flush)
+
+
+def flush():
+    writer.flush()
+
+
+def init_db():
+    global _schema_ready
+    with _schema_lock:
+        if not _schema_ready:
+            conn = thread_connection()
+            conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+            migrations.print_report(migrations.migrate(conn))
+            _schema_ready = True
+
+
+def normalize_goal(task_name):
+    # Case and whitespace don't change what a task is about
+    return " ".join(task_name.lower().split())
+
+
+# Tasks
+
+# Rows are (id, task_name, completed, due_date, position)
+TASK_COLUMNS = "id, task_name, completed, due_date, position"
+
+
+def load_tasks(user_id, completed=None, after=None, limit=-1, due_date=None):
+    # Keyset pagination in position order: pass the (position, id) of the
+    # last row of the previous page as after. That row's current position
+    # is used if it still exists, so a rebalance in between doesn't skip
+    # or repeat rows. A negative limit means no limit. due_date None loads
+    # undated tasks.
+    writer.flush()
+    after_position, after_id = after or (float('-inf'), 0)
+    keyset = "(position, id) > (coalesce((SELECT position FROM tasks WHERE id = ?), ?), ?)"
+    if completed is None:
+        cursor = get_connection().execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE user_id = ? AND due_date IS ? AND {keyset} "
+            "ORDER BY position, id LIMIT ?",
+            (user_id, due_date, after_id, after_position, after_id, limit)
+        )
+    else:
+        cursor = get_connection().execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE user_id = ? AND due_date IS ? AND completed = ? AND {keyset} "
+            "ORDER BY position, id LIMIT ?",
+            (user_id, due_date, completed, after_id, after_position, after_id, limit)
+        )
+    return cursor.fetchall()
+
+
+def get_tasks(user_id, task_ids):
+    writer.flush()
+    rows = []
+    for start in range(0, len(task_ids), 500):
+        chunk = task_ids[start:start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor = get_connection().execute(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE user_id = ? AND id IN ({placeholders})",
+            (user_id, *chunk)
+        )
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def count_tasks(user_id, completed, due_date=None):
+    writer.flush()
+    cursor = get_connection().execute(
+        "SELECT COUNT(*) FROM tasks WHERE user_id = ? AND due_date IS ? AND completed = ?",
+        (user_id, due_date, completed)
+    )
+    return cursor.fetchone()[0]
+
+
+def add_task(user_id, task_name, completed=False):
+    writer.flush()
+    conn = get_connection()
+    cursor = conn.execute(
+        "INSERT INTO tasks (task_name, completed, user_id, goal, position) VALUES (?, ?, ?, ?, "
+        "(SELECT coalesce(MAX(position), 0) + 1 FROM tasks WHERE user_id = ? AND due_date IS NULL))",
+        (task_name, completed, user_id, normalize_goal(task_name), user_id)
+    )
+    conn.commit()
+    return cursor.lastrowid
+
+
+def add_tasks(user_id, rows):
+    # rows: iterable of (task_name, completed), inserted in one transaction.
+    # Returns how many were inserted.
+    writer.flush()
+    conn = get_connection()
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_rows (task_name TEXT, completed BOOLEAN, goal TEXT)")
+    with conn:
+        conn.executemany(
+            "INSERT INTO temp.import_rows (task_name, completed, goal) VALUES (?, ?, ?)",
+            ((task_name, completed, normalize_goal(task_name)) for task_name, completed in rows)
+        )
+        # One INSERT ... SELECT instead of one INSERT per row: FTS5 flushes
+        # its pending index data at every statement, so this runs the
+        # tasks_fts trigger about 3x faster.
+        cursor = conn.execute('''
+            INSERT INTO tasks (task_name, completed, user_id, goal, position)
+            SELECT task_name, completed, ?, goal,
+                   (SELECT coalesce(MAX(position), 0) FROM tasks WHERE user_id = ? AND due_date IS NULL) + rowid
+            FROM temp.import_rows ORDER BY rowid
+        ''', (user_id, user_id))
+        conn.execute("DELETE FROM temp.import_rows")
+    return cursor.rowcount
+
+
+def iter_tasks(user_id):
+    # Streams the user's tasks in list order without materializing them:
+    # (id, task_name, completed, due_date), undated tasks first
+    writer.flush()
+    cursor = get_connection().execute(
+        "SELECT id, task_name, completed, due_date FROM tasks WHERE user_id = ? ORDER BY due_date, position, id",
+        (user_id,)
+    )
+    yield from cursor
+
+
+def update_task_name(task_id, task_name):
+    writer.submit(
+        'name', task_id, "UPDATE tasks SET task_name = ?, goal = ? WHERE id = ?",
+        (task_name, normalize_goal(task_name), task_id)
+    )
+
+
+def update_task_completed(task_id, completed):
+    writer.submit('completed', task_id, "UPDATE tasks SET completed = ? WHERE id = ?", (completed, task_id))
+
+
+def delete_task(task_id):
+    writer.submit('delete', task_id, "DELETE FROM tasks WHERE id = ?", (task_id,))
+
+
+def delete_completed(user_id):
+    # Returns the ids of the deleted tasks. Only undated tasks: the
+    # completed instances of recurring tasks are their streak history.
+    writer.flush()
+    conn = get_connection()
+    cursor = conn.execute(
+        "DELETE FROM tasks WHERE user_id = ? AND due_date IS NULL AND completed = 1 RETURNING id", (user_id,)
+    )
+    deleted_ids = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    return deleted_ids
+
+
+def move_task(task_id, before_id):
+    # Moves a task to just after before_id, or to the top of its list if
+    # before_id is None, by changing only its own position. Returns the
+    # new position.
+    writer.flush()
+    conn = get_connection()
+    user_id, due_date = conn.execute("SELECT user_id, due_date FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    low, high = neighbour_positions(conn, user_id, due_date, task_id, before_id)
+    rebalance = low is not None and high is not None and high - low < REBALANCE_GAP
+    if rebalance and not low < (low + high) / 2 < high:
+        # Out of floating point room: renumber now rather than later
+        rebalance_positions(conn, user_id, due_date)
+        low, high = neighbour_positions(conn, user_id, due_date, task_id, before_id)
+        rebalance = False
+    if low is None and high is None:
+        position = 1.0
+    elif low is None:
+        position = high - 1
+    elif high is None:
+        position = low + 1
+    else:
+        position = (low + high) / 2
+    with conn:
+        conn.execute("UPDATE tasks SET position = ? WHERE id = ?", (position, task_id))
+    # Only once the midpoint is written, or a flush in between would renumber
+    # the list and then place the task by the old numbering
+    if rebalance:
+        writer.submit('rebalance', (user_id, due_date), REBALANCE_SQL, (user_id, due_date))
+    return position
+
+
+def neighbour_positions(conn, user_id, due_date, task_id, before_id):
+    # Positions of the tasks that will be just before and just after the
+    # moved one; None at either end of the list
+    if before_id is None:
+        low = None
+        cursor = conn.execute(
+            "SELECT position FROM tasks WHERE user_id = ? AND due_date IS ? AND id != ? ORDER BY position, id LIMIT 1",
+            (user_id, due_date, task_id)
+        )
+    else:
+        low = conn.execute("SELECT position FROM tasks WHERE id = ?", (before_id,)).fetchone()[0]
+        cursor = conn.execute(
+            "SELECT position FROM tasks WHERE user_id = ? AND due_date IS ? AND (position, id) > (?, ?) AND id != ? "
+            "ORDER BY position, id LIMIT 1",
+            (user_id, due_date, low, before_id, task_id)
+        )
+    row = cursor.fetchone()
+    return low, row[0] if row else None
+
+
+REBALANCE_SQL = '''
+    UPDATE tasks SET position = ranked.n FROM (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY position, id) AS n FROM tasks WHERE user_id = ? AND due_date IS ?
+    ) AS ranked
+    WHERE tasks.id = ranked.id
+'''
+
+
+def rebalance_positions(conn, user_id, due_date):
+    with conn:
+        conn.execute(REBALANCE_SQL, (user_id, due_date))
+
+
+def match_query(text):
+    # Turns free text into an FTS5 query: every word must appear, the last
+    # one may be a prefix (the user is probably still typing it).
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def search_tasks(user_id, text, completed=None, offset=0, limit=-1):
+    # Best matches first among undated tasks; paged by offset since rank
+    # order has no key to continue from. Only the newest
+    # SEARCH_MAX_CANDIDATES matches are ranked together: past them results
+    # go on with the next newest as many, ranked among themselves, and so on.
+    match = match_query(text)
+    if match is None:
+        return []
+    writer.flush()
+    sql = f'''
+        SELECT {TASK_COLUMNS} FROM (
+            SELECT tasks.id, tasks.task_name, tasks.completed, tasks.due_date, tasks.position,
+                   bm25(tasks_fts, {SEARCH_NAME_WEIGHT}, 1.0) AS score
+            FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH ? AND tasks.user_id = ? AND tasks.due_date IS NULL
+            {"" if completed is None else "AND tasks.completed = ?"}
+            ORDER BY tasks_fts.rowid DESC LIMIT ? OFFSET ?
+        ) ORDER BY score LIMIT ? OFFSET ?
+    '''
+    params = (match, user_id) + (() if completed is None else (completed,))
+    conn = get_connection()
+    rows = []
+    window, offset = divmod(offset, SEARCH_MAX_CANDIDATES)
+    while True:
+        wanted = -1 if limit < 0 else limit - len(rows)
+        page = conn.execute(
+            sql, params + (SEARCH_MAX_CANDIDATES, window * SEARCH_MAX_CANDIDATES, wanted, offset)
+        ).fetchall()
+        rows += page
+        # A window with fewer candidates than the cap was the last one
+        if 0 <= limit <= len(rows) or offset + len(page) < SEARCH_MAX_CANDIDATES:
+            return rows
+        window, offset = window + 1, 0
+
+
+# Recurring tasks
+#
+# A recurrence is a task that repeats on some weekdays (bit 0 = Monday in
+# the weekdays mask). Each day it is due it gets one ordinary task row,
+# its instance, dated with due_date; past instances are kept for streaks.
+
+EVERY_DAY = 0b1111111
+
+
+def today():
+    return datetime.date.today().isoformat()
+
+
+def schedule_day(user_id, day=None):
+    # Creates the user's instances for day, at most once per day: the
+    # first call of the day claims it in users.scheduled_on and inserts
+    # every instance with one statement. Returns how many were created.
+    day = day or today()
+    weekday = datetime.date.fromisoformat(day).weekday()
+    writer.flush()
+    conn = get_connection()
+    with conn:
+        claimed = conn.execute(
+            "UPDATE users SET scheduled_on = ? WHERE id = ? AND (scheduled_on IS NULL OR scheduled_on < ?)",
+            (day, user_id, day)
+        ).rowcount
+        if not claimed:
+            return 0
+        return insert_instances(conn, user_id, day, weekday)
+
+
+def insert_instances(conn, user_id, day, weekday, recurrence_id=None):
+    return conn.execute('''
+        INSERT OR IGNORE INTO tasks (task_name, completed, user_id, goal, recurrence_id, due_date, position)
+        SELECT task_name, 0, user_id, goal, id, ?, id FROM recurrences
+        WHERE user_id = ? AND active = 1 AND (weekdays >> ?) & 1 AND (? IS NULL OR id = ?)
+    ''', (day, user_id, weekday, recurrence_id, recurrence_id)).rowcount
+
+
+def add_recurrence(user_id, task_name, weekdays=EVERY_DAY, day=None):
+    # Returns (recurrence id, id of today's instance or None if it isn't
+    # due today)
+    if not weekdays & EVERY_DAY:
+        raise ValueError("a recurring task needs at least one weekday")
+    day = day or today()
+    conn = get_connection()
+    with conn:
+        recurrence_id = conn.execute(
+            "INSERT INTO recurrences (user_id, task_name, goal, weekdays) VALUES (?, ?, ?, ?)",
+            (user_id, task_name, normalize_goal(task_name), weekdays)
+        ).lastrowid
+        insert_instances(conn, user_id, day, datetime.date.fromisoformat(day).weekday(), recurrence_id)
+        row = conn.execute(
+            "SELECT id FROM tasks WHERE recurrence_id = ? AND due_date = ?", (recurrence_id, day)
+        ).fetchone()
+    return recurrence_id, row[0] if row else None
+
+
+def rename_recurrence(task_id, task_name):
+    # Renames the recurrence an instance belongs to, so later instances
+    # get the new name too
+    conn = get_connection()
+    conn.execute(
+        "UPDATE recurrences SET task_name = ?, goal = ? WHERE id = (SELECT recurrence_id FROM tasks WHERE id = ?)",
+        (task_name, normalize_goal(task_name), task_id)
+    )
+    conn.commit()
+
+
+def end_recurrence(task_id):
+    # Stops the recurrence an instance belongs to; its history is kept
+    conn = get_connection()
+    conn.execute(
+        "UPDATE recurrences SET active = 0 WHERE id = (SELECT recurrence_id FROM tasks WHERE id = ?)", (task_id,)
+    )
+    conn.commit()
+
+
+def last_due_day(day, weekdays):
+    # The latest day on or before day that weekdays includes
+    while not (weekdays >> day.weekday()) & 1:
+        day -= datetime.timedelta(days=1)
+    return day
+
+
+def streaks(user_id, day=None):
+    # {task name: number of consecutive due days, up to day, whose instance
+    # was completed} for each active recurrence; today counts once it is
+    # done. Past instances can't change any more, so each recurrence keeps
+    # its streak up to the last settled due day and only the days since
+    # then are read.
+    day = datetime.date.fromisoformat(day or today())
+    writer.flush()
+    conn = get_connection()
+    result = {}
+    with conn:
+        for recurrence_id, task_name, weekdays, settled, settled_date in conn.execute(
+            "SELECT id, task_name, weekdays, streak, streak_date FROM recurrences WHERE user_id = ? AND active = 1",
+            (user_id,)
+        ).fetchall():
+            last = last_due_day(day - datetime.timedelta(days=1), weekdays).isoformat()
+            if settled_date is not None and last < settled_date:
+                # Asked about a day before the checkpoint
+                settled = streak_through(conn, recurrence_id, weekdays, last, 0, None)
+            elif last != settled_date:
+                settled = streak_through(conn, recurrence_id, weekdays, last, settled, settled_date)
+                conn.execute(
+                    "UPDATE recurrences SET streak = ?, streak_date = ? WHERE id = ?", (settled, last, recurrence_id)
+                )
+            done_today = conn.execute(
+                "SELECT completed FROM tasks WHERE recurrence_id = ? AND due_date = ?",
+                (recurrence_id, day.isoformat())
+            ).fetchone()
+            result[task_name] = settled + (1 if done_today and done_today[0] else 0)
+    return result
+
+
+def streak_through(conn, recurrence_id, weekdays, through, settled, settled_date):
+    # Completed due days in a row ending at through, continuing into the
+    # settled streak if the run reaches settled_date. A due day without an
+    # instance (the app wasn't opened) ends the run.
+    streak = 0
+    expected = through
+    for due_date, completed in conn.execute(
+        "SELECT due_date, completed FROM tasks WHERE recurrence_id = ? AND due_date <= ? AND due_date > ? "
+        "ORDER BY due_date DESC",
+        (recurrence_id, through, settled_date or '')
+    ):
+        if due_date != expected or not completed:
+            return streak
+        streak += 1
+        expected = last_due_day(datetime.date.fromisoformat(due_date) - datetime.timedelta(days=1), weekdays)
+        expected = expected.isoformat()
+    if expected == settled_date:
+        streak += settled
+    return streak
+
+
+# Plans
+
+def get_plans(keys):
+    writer.flush()
+    plans = {}
+    now = time.time()
+    # Stay well under SQLite's bound-parameter limit
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor = get_connection().execute(
+            f"SELECT key, plan FROM plans WHERE key IN ({placeholders}) AND created_at > ?",
+            (*chunk, now - PLAN_CACHE_TTL)
+        )
+        plans.update(cursor.fetchall())
+    for key in plans:
+        writer.submit('plan_used', key, "UPDATE plans SET last_used = ? WHERE key = ?", (now, key))
+    return plans
+
+
+def put_plan(key, goal, plan):
+    put_plans([(key, goal, plan)])
+
+
+def put_plans(items):
+    # items: iterable of (key, goal, plan); written and evicted in one
+    # transaction
+    writer.flush()
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO plans (key, plan, created_at, last_used, goal) VALUES (?, ?, ?, ?, ?)",
+            ((key, plan, now, now, goal) for key, goal, plan in items)
+        )
+        evict_plans(conn, now)
+
+
+def evict_plans(conn, now):
+    conn.execute("DELETE FROM plans WHERE created_at <= ?", (now - PLAN_CACHE_TTL,))
+    conn.execute('''
+        DELETE FROM plans WHERE key IN (
+            SELECT key FROM plans ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        )
+    ''', (PLAN_CACHE_MAX_ENTRIES,))
+
+
+# Users
+
+def user_exists(username):
+    cursor = get_connection().execute("SELECT COUNT(1) FROM users WHERE username = ?", (username,))
+    return cursor.fetchone()[0] > 0
+
+
+def get_user(username):
+    cursor = get_connection().execute("SELECT id, password FROM users WHERE username = ?", (username,))
+    return cursor.fetchone()
+
+
+def add_user(username, password):
+    conn = get_connection()
+    conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
+    conn.commit()
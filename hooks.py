@@ -0,0 +1,36 @@
+import functools
+
+# Event handlers decorated with @handler run through every installed hook.
+# A hook is called as hook(name, args, call), where name is the handler's
+# qualified name and args its positional arguments (self and the event), and
+# must return call(). The first hook added is the outermost. With no hooks
+# installed a handler costs one extra call and a truth test.
+_hooks = []
+
+
+# Both rebind the list rather than change it, so a handler that is running
+# keeps the hooks it started with.
+def add_hook(hook):
+    global _hooks
+    _hooks = [*_hooks, hook]
+
+
+def remove_hook(hook):
+    global _hooks
+    _hooks = [other for other in _hooks if other is not hook]
+
+
+def handler(func):
+    name = func.__qualname__.replace("<locals>.", "")
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        hooks = _hooks
+        if not hooks:
+            return func(*args)
+        call = functools.partial(func, *args)
+        for hook in reversed(hooks):
+            call = functools.partial(hook, name, args, call)
+        return call()
+
+    return wrapper
@@ -1,5 +1,6 @@
 import flet as ft
-import sqlite3
+import db
+import hooks
 
 class LoginPage(ft.Column):
     def __init__(self, on_login_success):
@@ -38,12 +39,14 @@ class LoginPage(ft.Column):
 
         self.is_registering = False
 
+    @hooks.handler
     def submit_clicked(self, e):
         if self.is_registering:
             self.register_user()
         else:
             self.login_user()
 
+    @hooks.handler
     def switch_to_register(self, e):
         self.is_registering = True
         self.controls[0] = ft.Row([ft.Text("Register", theme_style=ft.TextThemeStyle.HEADLINE_MEDIUM)], alignment=ft.MainAxisAlignment.CENTER)
@@ -54,8 +57,9 @@ class LoginPage(ft.Column):
         username = self.username.value
         password = self.password.value
 
-        if self.check_user_credentials(username, password):
-            self.on_login_success()
+        user_id = self.check_user_credentials(username, password)
+        if user_id is not None:
+            self.on_login_success(user_id)
         else:
             self.error_message.value = "Invalid username or password!"
             self.update()
@@ -79,25 +83,13 @@ class LoginPage(ft.Column):
             self.update()
 
     def check_user_exists(self, username):
-        conn = sqlite3.connect('tasks.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(1) FROM users WHERE username = ?", (username,))
-        exists = cursor.fetchone()[0] > 0
-        conn.close()
-        return exists
+        return db.user_exists(username)
 
     def check_user_credentials(self, username, password):
-        conn = sqlite3.connect('tasks.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
-        stored_password = cursor.fetchone()
-        conn.close()
-        
-        return stored_password and stored_password[0] == password
+        user = db.get_user(username)
+        if user and user[1] == password:
+            return user[0]
+        return None
 
     def add_user_to_db(self, username, password):
-        conn = sqlite3.connect('tasks.db')
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-        conn.commit()
-        conn.close()
+        db.add_user(username, password)
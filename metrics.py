@@ -0,0 +1,192 @@
+import bisect
+import json
+import os
+import threading
+import time
+import db
+import hooks
+
+# In-process counters and histograms for event handlers, SQL statements and
+# OpenAI calls. Off unless started (TASKS_METRICS_PORT): until then the
+# handler hook and SQL trace aren't installed and inc()/observe() return at
+# once. Once started they are served on 127.0.0.1:<port> as Prometheus text
+# at /metrics and as JSON at /metrics.json, along with any ACTIONS.
+PORT_ENV = 'TASKS_METRICS_PORT'
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "tasks_handler_seconds": "Time spent in a UI event handler",
+    "tasks_handler_errors_total": "UI event handler calls that raised",
+    "tasks_sql_statements_total":
+        "SQL statements run, by first keyword; internal ones are run by SQLite for triggers and FTS5",
+    "openai_requests_total": "Plan requests to the OpenAI API, by outcome (ok, cancelled, error or HTTP status)",
+    "openai_request_seconds": "Time from sending a plan request to its last token",
+    "openai_first_token_seconds": "Time from sending a plan request to its first token",
+    "openai_tokens_total": "Tokens reported by the OpenAI API",
+    "openai_connections_total": "OpenAI API requests that opened a new pooled connection or reused an idle one",
+}
+
+enabled = False
+
+# POST paths served next to the metrics, e.g. by profiling.py: path -> a
+# function returning the JSON response
+ACTIONS = {}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_server = None
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    if not enabled:
+        return
+    key = (name, labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    if not enabled:
+        return
+    key = (name, labels_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+
+def handler_hook(name, args, call):
+    start = time.perf_counter()
+    try:
+        return call()
+    except BaseException:
+        inc("tasks_handler_errors_total", handler=name)
+        raise
+    finally:
+        observe("tasks_handler_seconds", time.perf_counter() - start, handler=name)
+
+
+def sql_trace(sql, kind):
+    if kind is not None:
+        inc("tasks_sql_statements_total", kind=kind)
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(histogram) for key, histogram in _histograms.items()}
+    result = {"counters": {}, "histograms": {}}
+    for (name, labels), value in sorted(counters.items()):
+        result["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+    for (name, labels), histogram in sorted(histograms.items()):
+        count = sum(histogram[:-1])
+        result["histograms"].setdefault(name, []).append({
+            "labels": dict(labels),
+            "count": count,
+            "sum": histogram[-1],
+            "mean": histogram[-1] / count if count else None,
+            "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], histogram[:-1])),
+        })
+    return result
+
+
+def format_labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def prometheus_text():
+    data = snapshot()
+    lines = []
+    for name, series in data["counters"].items():
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+        lines += [f"{name}{format_labels(entry['labels'])} {entry['value']}" for entry in series]
+    for name, series in data["histograms"].items():
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+        for entry in series:
+            cumulative = 0
+            for le, count in entry["buckets"].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(entry['labels'], le=le)} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(entry['labels'])} {entry['sum']}")
+            lines.append(f"{name}_count{format_labels(entry['labels'])} {entry['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def serve(port):
+    # http.server is only imported when metrics are served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = prometheus_text(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(snapshot()), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.respond(body, content_type)
+
+        def do_POST(self):
+            action = ACTIONS.get(self.path)
+            if action is None:
+                self.send_error(404)
+                return
+            self.respond(json.dumps(action()), "application/json")
+
+        def respond(self, body, content_type):
+            body = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def start(port=None):
+    # Starts collecting; with a port, also serves the metrics on it
+    global enabled, _server
+    if not enabled:
+        enabled = True
+        hooks.add_hook(handler_hook)
+        db.add_trace_callback(sql_trace)
+    if port is not None and _server is None:
+        _server = serve(port)
+
+
+def stop():
+    global enabled, _server
+    if enabled:
+        enabled = False
+        hooks.remove_hook(handler_hook)
+        db.remove_trace_callback(sql_trace)
+    if _server is not None:
+        _server.shutdown()
+        _server = None
+
+
+def start_from_env():
+    port = os.environ.get(PORT_ENV)
+    if port:
+        start(int(port))
@@ -0,0 +1,231 @@
+import sys
+import time
+import db
+
+# Schema changes for tasks.db, oldest first. A database's PRAGMA user_version
+# is the number of migrations applied to it. Only append to MIGRATIONS: a
+# migration's version is its place in the list.
+#
+# Databases created before versioning are at version 0 with any mix of these
+# changes already applied, so every migration must be safe to run again.
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def create_users(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+    ''')
+
+
+def create_tasks(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_name TEXT NOT NULL,
+            completed BOOLEAN NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def add_task_owner(conn):
+    if 'user_id' not in columns(conn, 'tasks'):
+        conn.execute("ALTER TABLE tasks ADD COLUMN user_id INTEGER REFERENCES users(id)")
+        # Older databases had no owner column; hand their tasks to the only
+        # account if there is exactly one, otherwise leave them unowned.
+        conn.execute('''
+            UPDATE tasks SET user_id = (SELECT MIN(id) FROM users)
+            WHERE (SELECT COUNT(*) FROM users) = 1
+        ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_id ON tasks (user_id, id)")
+
+
+def create_plans(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS plans (
+            key TEXT PRIMARY KEY,
+            plan TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_last_used ON plans (last_used)")
+
+
+def add_recurrences(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recurrences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            task_name TEXT NOT NULL,
+            goal TEXT NOT NULL,
+            weekdays INTEGER NOT NULL,
+            active BOOLEAN NOT NULL DEFAULT 1,
+            streak INTEGER NOT NULL DEFAULT 0,
+            streak_date TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurrences_user ON recurrences (user_id, active)")
+    if 'recurrence_id' not in columns(conn, 'tasks'):
+        conn.execute("ALTER TABLE tasks ADD COLUMN recurrence_id INTEGER REFERENCES recurrences(id)")
+        conn.execute("ALTER TABLE tasks ADD COLUMN due_date TEXT")
+    if 'scheduled_on' not in columns(conn, 'users'):
+        conn.execute("ALTER TABLE users ADD COLUMN scheduled_on TEXT")
+    # At most one instance of a recurring task per day; also serves streaks
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_recurrence_due ON tasks (recurrence_id, due_date) "
+        "WHERE recurrence_id IS NOT NULL"
+    )
+
+
+def add_positions(conn):
+    if 'position' not in columns(conn, 'tasks'):
+        conn.execute("ALTER TABLE tasks ADD COLUMN position REAL NOT NULL DEFAULT 0")
+        # Keep the old id order
+        conn.execute("UPDATE tasks SET position = id")
+    # Undated tasks are the to-do list, tasks due today the daily list;
+    # both are shown in position order. These replace the id-ordered
+    # indexes unversioned databases may still have.
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_user_completed")
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_user_due")
+    conn.execute("DROP INDEX IF EXISTS idx_tasks_user_due_completed")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_position ON tasks (user_id, due_date, position, id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_completed_position "
+        "ON tasks (user_id, due_date, completed, position, id)"
+    )
+
+
+def add_goals(conn):
+    # goal is the normalized task text; it links a task to the plans made
+    # for it so plan text can be searched too. Plans cached before this
+    # column existed stay unlinked until they are generated again.
+    if 'goal' not in columns(conn, 'tasks'):
+        conn.execute("ALTER TABLE tasks ADD COLUMN goal TEXT NOT NULL DEFAULT ''")
+        conn.executemany(
+            "UPDATE tasks SET goal = ? WHERE id = ?",
+            ((db.normalize_goal(task_name), task_id) for task_id, task_name in
+             conn.execute("SELECT id, task_name FROM tasks").fetchall())
+        )
+    if 'goal' not in columns(conn, 'plans'):
+        conn.execute("ALTER TABLE plans ADD COLUMN goal TEXT NOT NULL DEFAULT ''")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_goal ON tasks (goal)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_goal ON plans (goal)")
+
+
+# SQL for the text of the newest plan made for {goal}, or '' if there is none
+LATEST_PLAN = '''coalesce((
+    SELECT plan FROM plans WHERE plans.goal = {goal} AND plans.goal != '' ORDER BY created_at DESC LIMIT 1
+), '')'''
+
+
+def add_search_index(conn):
+    # tasks_fts holds every task's name and the text of its latest plan under
+    # the task's id; the triggers below keep it in step with both tables.
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'").fetchone()
+    if not exists:
+        conn.execute("CREATE VIRTUAL TABLE tasks_fts USING fts5(task_name, plan, prefix='2 3')")
+        conn.execute(f'''
+            INSERT INTO tasks_fts (rowid, task_name, plan)
+            SELECT id, task_name, {LATEST_PLAN.format(goal='tasks.goal')} FROM tasks
+        ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, task_name, plan)
+            VALUES (NEW.id, NEW.task_name, {LATEST_PLAN.format(goal='NEW.goal')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF task_name, goal ON tasks BEGIN
+            UPDATE tasks_fts SET task_name = NEW.task_name, plan = {LATEST_PLAN.format(goal='NEW.goal')}
+            WHERE rowid = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            DELETE FROM tasks_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    # INSERT OR REPLACE into plans fires only the insert trigger
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS plans_fts_insert AFTER INSERT ON plans WHEN NEW.goal != '' BEGIN
+            UPDATE tasks_fts SET plan = NEW.plan WHERE rowid IN (SELECT id FROM tasks WHERE goal = NEW.goal);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS plans_fts_delete AFTER DELETE ON plans WHEN OLD.goal != '' BEGIN
+            UPDATE tasks_fts SET plan = {LATEST_PLAN.format(goal='OLD.goal')}
+            WHERE rowid IN (SELECT id FROM tasks WHERE goal = OLD.goal);
+        END
+    ''')
+
+
+MIGRATIONS = [
+    create_users,
+    create_tasks,
+    add_task_owner,
+    create_plans,
+    add_recurrences,
+    add_positions,
+    add_goals,
+    add_search_index,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    # Applies the migrations the database has not had yet, each in its own
+    # transaction together with its version bump. Returns a report of
+    # (version, name, seconds) for the ones applied.
+    report = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if schema_version(conn) >= version:
+            continue
+        start = time.perf_counter()
+        # IMMEDIATE takes the write lock first; if another process got there
+        # first, the version read inside the transaction says so.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            applied = schema_version(conn) < version
+            if applied:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if applied:
+            report.append((version, migration.__name__, time.perf_counter() - start))
+    return report
+
+
+def print_report(report, file=sys.stderr):
+    for version, name, seconds in report:
+        print(f"migration {version:>3} {name:<20} {seconds * 1000:>9.1f} ms", file=file)
+
+
+def main(argv=None):
+    # python migrations.py [path]: bring a database up to date and show what ran
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        db.DB_PATH = argv[0]
+    before = schema_version(db.thread_connection())
+    db.init_db()
+    print(f"{db.DB_PATH}: schema version {before} -> {schema_version(db.get_connection())} "
+          f"(latest {LATEST_VERSION})")
+    db.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+
+# Process-wide admission control for plan requests from every session:
+# identical in-flight prompts share one request, request/token buckets keep
+# us under the account's rate limits, and waiting requests are served
+# round-robin per user so one user planning hundreds of goals can't starve
+# everyone else.
+MAX_CONCURRENT_PLANS = int(os.environ.get('MAX_CONCURRENT_PLANS', '4'))
+REQUESTS_PER_MINUTE = int(os.environ.get('OPENAI_REQUESTS_PER_MINUTE', '500'))
+TOKENS_PER_MINUTE = int(os.environ.get('OPENAI_TOKENS_PER_MINUTE', '200000'))
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.refill()
+        self.tokens -= amount
+
+    def sync(self, limit, remaining):
+        # The server's view of our quota wins over our own estimate
+        self.refill()
+        self.capacity = limit
+        self.rate = limit / 60
+        self.tokens = min(self.tokens, remaining)
+
+
+class Flight:
+    # One in-flight request; every caller asking for the same plan follows it
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.task = None
+        self.changed = asyncio.Condition()
+
+    async def publish(self, text):
+        async with self.changed:
+            self.chunks.append(text)
+            self.changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self.changed:
+            self.done = True
+            self.error = error
+            self.changed.notify_all()
+
+    async def follow(self):
+        seen = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: self.done or len(self.chunks) > seen)
+                chunks = self.chunks[seen:]
+                done, error = self.done, self.error
+            for text in chunks:
+                yield text
+            seen += len(chunks)
+            if done and seen == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class PlanBroker:
+    def __init__(self, max_concurrent=MAX_CONCURRENT_PLANS, requests_per_minute=REQUESTS_PER_MINUTE,
+                 tokens_per_minute=TOKENS_PER_MINUTE):
+        self.max_concurrent = max_concurrent
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.running = 0
+        # user_id -> deque of (future, estimated_tokens); the first user in
+        # the dict is served next and then moved to the back.
+        self.queues = OrderedDict()
+        self.flights = {}
+        self.timer = None
+
+    async def stream(self, key, user_id, estimated_tokens, request):
+        # request() returns an async iterator of text chunks; it is only
+        # called for the first caller with a given key.
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight()
+            self.flights[key] = flight
+            flight.task = asyncio.create_task(self.fly(key, flight, user_id, estimated_tokens, request))
+        flight.followers += 1
+        try:
+            async for text in flight.follow():
+                yield text
+        finally:
+            flight.followers -= 1
+            if flight.followers == 0 and not flight.done:
+                # Nobody is waiting for this plan any more
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                flight.task.cancel()
+
+    async def fly(self, key, flight, user_id, estimated_tokens, request):
+        try:
+            await self.acquire(user_id, estimated_tokens)
+            try:
+                async for text in request():
+                    await flight.publish(text)
+            finally:
+                self.release()
+        except asyncio.CancelledError:
+            await flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as ex:
+            await flight.finish(ex)
+        else:
+            await flight.finish()
+        finally:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    async def acquire(self, user_id, estimated_tokens):
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(user_id, deque()).append((future, estimated_tokens))
+        self.dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted a slot in the same tick we were cancelled: give it back
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.running -= 1
+        self.dispatch()
+
+    def dispatch(self):
+        while self.running < self.max_concurrent and self.queues:
+            user_id, queue = next(iter(self.queues.items()))
+            future, estimated_tokens = queue[0]
+            if future.cancelled():
+                self.pop(user_id, queue)
+                continue
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+            if wait > 0:
+                if self.timer is None:
+                    self.timer = asyncio.get_running_loop().call_later(wait, self.wake)
+                return
+            self.pop(user_id, queue)
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            self.running += 1
+            future.set_result(None)
+
+    def pop(self, user_id, queue):
+        queue.popleft()
+        del self.queues[user_id]
+        if queue:
+            self.queues[user_id] = queue
+
+    def wake(self):
+        self.timer = None
+        self.dispatch()
+
+    def update_limits(self, headers):
+        # Fed from the x-ratelimit-* headers of every response
+        try:
+            if 'x-ratelimit-limit-requests' in headers:
+                self.requests.sync(int(headers['x-ratelimit-limit-requests']),
+                                   int(headers['x-ratelimit-remaining-requests']))
+            if 'x-ratelimit-limit-tokens' in headers:
+                self.tokens.sync(int(headers['x-ratelimit-limit-tokens']),
+                                 int(headers['x-ratelimit-remaining-tokens']))
+        except (KeyError, ValueError):
+            pass
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        self.tokens.take(actual_tokens - estimated_tokens)
+
+
+broker = None
+
+
+def get_broker():
+    # Created lazily so its asyncio primitives live on Flet's event loop
+    global broker
+    if broker is None:
+        broker = PlanBroker()
+    return broker
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import db
+import metrics
+from plan_broker import get_broker
+
+MODEL = "gpt-3.5-turbo"
+
+SYSTEM_PROMPT = "You are a helpful assistant. Create a detailed plan to \
+                     achieve the given goal, breaking it down into actionable steps with a timeline. Make sure \
+                     the plan is practical and achievable, including daily or weekly tasks, milestones, and any \
+                     additional tips or resources that might be helpful. Format the output in a proffesional manner \
+                     goal as a key and the plan/steps as sub-keys."
+
+# Completion tokens assumed for a plan when admitting it against the
+# tokens-per-minute budget; corrected from the reported usage afterwards.
+PLAN_TOKENS_ESTIMATE = 1000
+
+# Connection pool of the shared client; idle connections are kept warm for
+# KEEPALIVE_EXPIRY seconds so back-to-back plans skip the TLS handshake.
+MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+KEEPALIVE_EXPIRY = float(os.environ.get('OPENAI_KEEPALIVE_EXPIRY', '120'))
+
+_client = None
+_http_client = None
+_client_lock = threading.Lock()
+
+def plan_key(task_name):
+    # Same model, prompt and (case/whitespace-normalized) goal -> same plan
+    return hashlib.sha256(f"{MODEL}\0{SYSTEM_PROMPT}\0{db.normalize_goal(task_name)}".encode()).hexdigest()
+
+
+def get_cached_plans(task_names):
+    keys = {task_name: plan_key(task_name) for task_name in task_names}
+    plans = db.get_plans(list(set(keys.values())))
+    return {task_name: plans[key] for task_name, key in keys.items() if key in plans}
+
+
+def get_cached_plan(task_name):
+    return get_cached_plans([task_name]).get(task_name)
+
+
+def save_plan(task_name, plan):
+    db.put_plan(plan_key(task_name), db.normalize_goal(task_name), plan)
+
+
+def get_client():
+    # Config is read once, the first time a plan is requested. openai (with
+    # pydantic and httpx) and dotenv are imported here too rather than at
+    # startup; most sessions never ask for a plan. That takes about half a
+    # second, so code on the event loop should use get_client_async.
+    global _client, _http_client
+    with _client_lock:
+        if _client is None:
+            _client, _http_client = make_client()
+    return _client
+
+
+async def get_client_async():
+    if _client is not None:
+        return _client
+    return await asyncio.to_thread(get_client)
+
+
+def make_client():
+    import httpx
+    import openai
+    from dotenv import load_dotenv
+    load_dotenv(override = True)
+    http_client = openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        event_hooks={"request": [trace_connection]},
+    )
+    client = openai.AsyncOpenAI(
+        api_key=os.environ.get('OPENAI_API_KEY', "dont-know"),
+        http_client=http_client,
+    )
+    return client, http_client
+
+
+async def trace_connection(request):
+    # While metrics are on, counts whether each request opened a connection
+    # or reused a pooled one, through httpcore's "trace" request extension
+    if not metrics.enabled:
+        return
+    opened = False
+
+    async def trace(event, info):
+        nonlocal opened
+        if event == "connection.connect_tcp.complete":
+            opened = True
+        elif event.endswith(".send_request_headers.started"):
+            metrics.inc("openai_connections_total", connection="opened" if opened else "reused")
+
+    request.extensions["trace"] = trace
+
+
+def estimate_tokens(task_name):
+    return (len(SYSTEM_PROMPT) + len(task_name)) // 4 + PLAN_TOKENS_ESTIMATE
+
+
+async def stream_plan(task_name, user_id=None):
+    # Yields the plan text piece by piece as the model produces it. Goes
+    # through the broker, so identical in-flight requests share one call.
+    estimated_tokens = estimate_tokens(task_name)
+    async for text in get_broker().stream(
+        plan_key(task_name), user_id, estimated_tokens, lambda: request_plan(task_name, estimated_tokens)
+    ):
+        yield text
+
+
+async def request_plan(task_name, estimated_tokens):
+    client = await get_client_async()
+    import openai
+    broker = get_broker()
+    start = time.perf_counter()
+    first_token = None
+    usage = None
+    try:
+        response = await client.chat.completions.with_raw_response.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": task_name}
+            ],
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        broker.update_limits(response.headers)
+        async for chunk in response.parse():
+            if chunk.usage:
+                broker.record_usage(estimated_tokens, chunk.usage.total_tokens)
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                yield chunk.choices[0].delta.content
+    except openai.APIStatusError as ex:
+        metrics.inc("openai_requests_total", status=str(ex.status_code))
+        broker.update_limits(ex.response.headers)
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        # The user cancelled the plan, or nobody is following it any more
+        metrics.inc("openai_requests_total", status="cancelled")
+        raise
+    except BaseException:
+        metrics.inc("openai_requests_total", status="error")
+        raise
+    elapsed = time.perf_counter() - start
+    metrics.inc("openai_requests_total", status="ok")
+    metrics.observe("openai_request_seconds", elapsed)
+    if first_token is not None:
+        metrics.observe("openai_first_token_seconds", first_token)
+    if usage is not None:
+        metrics.inc("openai_tokens_total", usage.prompt_tokens, type="prompt")
+        metrics.inc("openai_tokens_total", usage.completion_tokens, type="completion")
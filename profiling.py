@@ -0,0 +1,208 @@
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+import hooks
+import metrics
+import recorder
+
+# On-demand profiling of event handlers in a running app. While it is on,
+# each selected handler call runs under cProfile with tracemalloc tracing,
+# and the SLOWEST slowest calls are kept with their profile and the
+# allocations they left behind; dump() writes them to the profile directory
+# as a .prof file (for pstats/snakeviz) and a readable .txt per call.
+#
+# Turn it on at startup with TASKS_PROFILE=1 (SIGUSR1 then dumps, where
+# there is one), or at runtime with POST /profiling/start, /profiling/stop
+# and /profiling/dump on the metrics port (see metrics.py).
+ENABLE_ENV = 'TASKS_PROFILE'
+DIR_ENV = 'TASKS_PROFILE_DIR'
+HANDLERS_ENV = 'TASKS_PROFILE_HANDLERS'
+SLOWEST_ENV = 'TASKS_PROFILE_SLOWEST'
+
+DEFAULT_DIR = 'profiles'
+SLOWEST = 20
+TRACEBACK_FRAMES = 5
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 20
+
+directory = DEFAULT_DIR
+
+
+class Profiler:
+    def __init__(self, handlers=None, slowest=SLOWEST):
+        # Handler names to profile, or prefixes ending in "." such as "Task.";
+        # all handlers if empty
+        self.handlers = handlers or []
+        self.slowest = slowest
+        self._calls = []  # min-heap of (seconds, seq, call), so the fastest kept call is first
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._active = threading.local()
+
+    def selected(self, name):
+        if not self.handlers:
+            return True
+        return any(name == handler or (handler.endswith(".") and name.startswith(handler))
+                   for handler in self.handlers)
+
+    def __call__(self, name, args, call):
+        # A thread can run one profiler at a time, so a handler called from
+        # another one is profiled as part of it
+        if not self.selected(name) or getattr(self._active, "running", False):
+            return call()
+        import cProfile
+        import tracemalloc
+        self._active.running = True
+        before = tracemalloc.take_snapshot()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile()
+        started = time.time()
+        error = None
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            return call()
+        except BaseException as ex:
+            error = repr(ex)
+            raise
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            self._active.running = False
+            # Unless profiling was stopped while this ran
+            if tracemalloc.is_tracing():
+                self.keep(elapsed, lambda: {
+                    "handler": name,
+                    "session": recorder.session_id(args),
+                    "thread": threading.current_thread().name,
+                    "started": started,
+                    "seconds": elapsed,
+                    "error": error,
+                    "memory_delta": tracemalloc.get_traced_memory()[0] - memory_before,
+                    "allocations": allocation_diff(before, tracemalloc.take_snapshot()),
+                    "profile": profile,
+                })
+
+    def keep(self, seconds, make_call):
+        # The allocation diff is only worked out for calls slow enough to keep
+        with self._lock:
+            if len(self._calls) >= self.slowest and seconds <= self._calls[0][0]:
+                return
+        entry = (seconds, next(self._seq), make_call())
+        with self._lock:
+            if len(self._calls) < self.slowest:
+                heapq.heappush(self._calls, entry)
+            else:
+                heapq.heappushpop(self._calls, entry)
+
+    def calls(self):
+        # Slowest first
+        with self._lock:
+            return [call for _, _, call in sorted(self._calls, key=lambda entry: entry[:2], reverse=True)]
+
+
+def allocation_diff(before, after):
+    # Allocations are traced process-wide, so other threads' show up too
+    import tracemalloc
+    ignore = (
+        tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+    )
+    stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "traceback")
+    return [stat for stat in stats if stat.size_diff][:TOP_ALLOCATIONS]
+
+
+def write_call(path, call):
+    import pstats
+    with open(path + ".txt", "w", encoding="utf-8") as file:
+        file.write(f"handler   {call['handler']}\n")
+        file.write(f"session   {call['session']}\n")
+        file.write(f"thread    {call['thread']}\n")
+        file.write(f"started   {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(call['started']))}\n")
+        file.write(f"duration  {call['seconds'] * 1000:.1f} ms (under the profiler)\n")
+        file.write(f"memory    {call['memory_delta']:+d} bytes still allocated afterwards\n")
+        if call["error"]:
+            file.write(f"raised    {call['error']}\n")
+        file.write("\nAllocations left behind, largest first:\n")
+        for stat in call["allocations"]:
+            file.write(f"{stat.size_diff:+10d} B {stat.count_diff:+6d} blocks\n")
+            file.write("".join(f"    {line}\n" for line in stat.traceback.format(most_recent_first=True)))
+        file.write("\nProfile by cumulative time:\n")
+        stats = pstats.Stats(call["profile"], stream=file)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    stats.dump_stats(path + ".prof")
+
+
+_profiler = None
+_running = False
+_lock = threading.Lock()
+
+
+def start(handlers=None, slowest=SLOWEST):
+    # Starts with an empty buffer; returns whether profiling is now on
+    global _profiler, _running
+    import tracemalloc
+    with _lock:
+        if not _running:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEBACK_FRAMES)
+            _profiler = Profiler(handlers, slowest)
+            hooks.add_hook(_profiler)
+            _running = True
+    return True
+
+
+def stop():
+    # The calls kept so far can still be dumped
+    global _running
+    with _lock:
+        if _running:
+            import tracemalloc
+            hooks.remove_hook(_profiler)
+            tracemalloc.stop()
+            _running = False
+    return False
+
+
+def dump():
+    # Writes the kept calls, slowest first, and returns the .txt paths
+    calls = _profiler.calls() if _profiler else []
+    if not calls:
+        return []
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    paths = []
+    for rank, call in enumerate(calls, 1):
+        path = os.path.join(directory, f"{stamp}-{rank:02d}-{call['handler']}")
+        write_call(path, call)
+        paths.append(path + ".txt")
+    return paths
+
+
+def dump_on_signal(signum, frame):
+    paths = dump()
+    print(f"profiling: wrote {len(paths)} calls to {directory}", file=sys.stderr)
+
+
+def settings_from_env():
+    handlers = [name.strip() for name in os.environ.get(HANDLERS_ENV, "").split(",") if name.strip()]
+    return handlers, int(os.environ.get(SLOWEST_ENV) or SLOWEST)
+
+
+def start_from_env():
+    global directory
+    directory = os.environ.get(DIR_ENV) or DEFAULT_DIR
+    if os.environ.get(ENABLE_ENV, "") not in ("", "0"):
+        start(*settings_from_env())
+        import signal
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, dump_on_signal)
+
+
+metrics.ACTIONS.update({
+    "/profiling/start": lambda: {"profiling": start(*settings_from_env())},
+    "/profiling/stop": lambda: {"profiling": stop()},
+    "/profiling/dump": lambda: {"files": dump()},
+})
@@ -0,0 +1,180 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import hooks
+
+# Opt-in recording of UI events: with TASKS_TRACE_FILE set, every decorated
+# event handler call is appended to that file as one JSON line, which
+# benchmarks/replay.py can drive the app with again. Records are captured on
+# the handler's thread and written in batches by a background thread.
+TRACE_FILE_ENV = 'TASKS_TRACE_FILE'
+FLUSH_INTERVAL_MS = 500
+FLUSH_MAX_RECORDS = 1000
+# While the file can't be written, records are kept up to this many; later
+# ones are dropped
+MAX_BUFFERED_RECORDS = 100_000
+
+
+def task_state(task, e):
+    # The name finds the task again when replaying into a database where it
+    # got a different id
+    return {"task_id": task.task_id, "task_name": task.task_name, "due_date": task.due_date}
+
+
+def view_state(task_list):
+    # Which list a TaskList is: the to-do list or a day's daily list
+    return {"view": "todo" if task_list.due_date is None else "daily"}
+
+
+# What each handler reads besides its event, keyed by handler name; replaying
+# a record sets this state back before calling the handler. Passwords are
+# never recorded.
+STATE = {
+    "LoginPage.submit_clicked": lambda page, e: {
+        "username": page.username.value, "registering": page.is_registering
+    },
+    "LoginPage.switch_to_register": lambda page, e: {},
+    "main.on_drawer_index_change": lambda page, e: {"index": page.drawer.selected_index},
+    "Task.edit_clicked": task_state,
+    "Task.save_clicked": lambda task, e: {**task_state(task, e), "new_name": task.edit_name.value},
+    "Task.status_changed": lambda task, e: {**task_state(task, e), "completed": task.display_task.value},
+    "Task.delete_clicked": task_state,
+    "Task.create_plan": task_state,
+    "Task.cancel_plan": task_state,
+    "TaskList.reordered": lambda task_list, e: {
+        **view_state(task_list), "old_index": e.old_index, "new_index": e.new_index
+    },
+    "TaskList.scrolled": lambda task_list, e: {
+        **view_state(task_list), "pixels": e.pixels, "max_scroll_extent": e.max_scroll_extent
+    },
+    "TodoApp.add_clicked": lambda view, e: {"task_name": view.new_task.value},
+    "TodoApp.search_changed": lambda view, e: {"query": view.search.value},
+    "TodoApp.tabs_changed": lambda view, e: {"index": view.filter.selected_index},
+    "TodoApp.clear_clicked": lambda view, e: {},
+    "TodoApp.plan_all_clicked": lambda view, e: {},
+    "DailyTasksApp.add_clicked": lambda view, e: {
+        "task_name": view.new_task.value,
+        "weekdays": sum(1 << day for day, checkbox in enumerate(view.weekdays) if checkbox.value),
+    },
+}
+
+
+def session_id(args):
+    # The session a handler runs in, from the page it is given or its
+    # control's or event's page
+    for arg in args:
+        if hasattr(arg, "session_id"):
+            return arg.session_id
+        page = getattr(arg, "page", None)
+        if page is not None:
+            return getattr(page, "session_id", None)
+    return None
+
+
+class TraceWriter:
+    def __init__(self, path, flush_interval_ms=FLUSH_INTERVAL_MS, max_records=FLUSH_MAX_RECORDS,
+                 max_buffered=MAX_BUFFERED_RECORDS):
+        self.path = path
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_records = max_records
+        self.max_buffered = max_buffered
+        self.dropped = 0
+        self._records = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def write(self, record):
+        with self._lock:
+            if len(self._records) >= self.max_buffered:
+                self.dropped += 1
+                return
+            self._records.append(record)
+            if len(self._records) == self.max_records:
+                self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                records, self._records = self._records, []
+            if not records:
+                return
+            # Serializing here keeps json off the handler's thread
+            lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+            try:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(lines)
+            except BaseException:
+                # Back in front of the newer records, within the bound
+                with self._lock:
+                    self._records[:0] = records
+                    if len(self._records) > self.max_buffered:
+                        self.dropped += len(self._records) - self.max_buffered
+                        del self._records[self.max_buffered:]
+                raise
+
+    def _run(self):
+        failing = False
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as ex:
+                if not failing:
+                    print(f"Error while writing the trace to {self.path}, retrying: {ex!r}", file=sys.stderr)
+                failing = True
+            else:
+                if failing:
+                    print(f"Writing the trace to {self.path} again; {self.dropped} events dropped so far",
+                          file=sys.stderr)
+                failing = False
+
+
+class Recorder:
+    def __init__(self, path):
+        self.writer = TraceWriter(path)
+
+    def __call__(self, name, args, call):
+        capture = STATE.get(name)
+        if capture is not None:
+            record = {"time": time.time(), "session": session_id(args), "handler": name}
+            # A failed capture is recorded rather than breaking the handler
+            try:
+                record["state"] = capture(*args)
+            except Exception as ex:
+                record["error"] = repr(ex)
+            self.writer.write(record)
+        return call()
+
+
+_recorder = None
+
+
+def start(path):
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder(path)
+        hooks.add_hook(_recorder)
+        atexit.register(stop)
+
+
+def stop():
+    global _recorder
+    if _recorder is not None:
+        hooks.remove_hook(_recorder)
+        _recorder.writer.flush()
+        _recorder = None
+
+
+def start_from_env():
+    path = os.environ.get(TRACE_FILE_ENV)
+    if path:
+        start(path)
@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+import db
+
+# Process-wide cache of recently changed task rows, keyed by user. The
+# session that changes a row writes the DB once and puts the new row here;
+# every other session of that user reads it from here instead of the DB.
+MAX_ROWS_PER_USER = 10000
+
+_rows = {}  # user_id -> OrderedDict of task_id -> row, or None once deleted
+_lock = threading.Lock()
+
+
+def put(user_id, rows=(), deleted_ids=()):
+    with _lock:
+        cache = _rows.setdefault(user_id, OrderedDict())
+        for row in rows:
+            cache[row[0]] = row
+            cache.move_to_end(row[0])
+        for task_id in deleted_ids:
+            cache[task_id] = None
+            cache.move_to_end(task_id)
+        while len(cache) > MAX_ROWS_PER_USER:
+            cache.popitem(last=False)
+
+
+def get_rows(user_id, task_ids):
+    # Returns {task_id: row} for the ids that still exist; ids evicted from
+    # the cache are looked up in the database.
+    found = {}
+    missing = []
+    with _lock:
+        cache = _rows.get(user_id, {})
+        for task_id in task_ids:
+            if task_id not in cache:
+                missing.append(task_id)
+            elif cache[task_id] is not None:
+                found[task_id] = cache[task_id]
+    if missing:
+        for row in db.get_tasks(user_id, missing):
+            found[row[0]] = row
+    return found
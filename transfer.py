@@ -0,0 +1,127 @@
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+import db
+
+# Rows per executemany/transaction when importing
+BATCH_SIZE = 10000
+
+# Same columns, in the same order, as the rows db.iter_tasks returns
+FIELDS = ("id", "task_name", "completed", "due_date")
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def parse_completed(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "x", "done")
+    return bool(value)
+
+
+def task_rows(records):
+    # Any id in the file is ignored; imported tasks get new ids. Rows with a
+    # due_date are exported instances of recurring tasks, which are history
+    # rather than to-dos, so they are skipped.
+    for record in records:
+        task_name = str(record.get("task_name") or "").strip()
+        if task_name and not record.get("due_date"):
+            yield task_name, parse_completed(record.get("completed", False))
+
+
+def write_csv(file, rows):
+    writer = csv.writer(file)
+    writer.writerow(FIELDS)
+    for task_id, task_name, completed, due_date in rows:
+        writer.writerow((task_id, task_name, int(bool(completed)), due_date or ""))
+
+
+def write_jsonl(file, rows):
+    for task_id, task_name, completed, due_date in rows:
+        file.write(json.dumps(
+            {"id": task_id, "task_name": task_name, "completed": bool(completed), "due_date": due_date}
+        ) + "\n")
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def import_tasks(user_id, file, file_format, batch_size=BATCH_SIZE):
+    # Returns how many tasks were imported
+    rows = task_rows(READERS[file_format](file))
+    imported = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return imported
+        imported += db.add_tasks(user_id, batch)
+
+
+def export_tasks(user_id, file, file_format):
+    # Returns how many tasks were exported
+    exported = 0
+
+    def counted(rows):
+        nonlocal exported
+        for row in rows:
+            exported += 1
+            yield row
+
+    WRITERS[file_format](file, counted(db.iter_tasks(user_id)))
+    return exported
+
+
+def guess_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return extension if extension in READERS else "csv"
+
+
+def open_file(path, mode):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export a user's tasks as CSV or JSONL")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("username")
+    parser.add_argument("path", help="file to read or write, - for stdin/stdout")
+    parser.add_argument("--format", choices=tuple(READERS), help="defaults to the file extension, else csv")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    user = db.get_user(args.username)
+    if user is None:
+        parser.error(f"no such user: {args.username}")
+    file_format = args.format or guess_format(args.path)
+
+    start = time.perf_counter()
+    if args.command == "import":
+        with open_file(args.path, "r") as file:
+            count = import_tasks(user[0], file, file_format, args.batch_size)
+    else:
+        with open_file(args.path, "w") as file:
+            count = export_tasks(user[0], file, file_format)
+    elapsed = time.perf_counter() - start
+    print(f"{args.command}ed {count} tasks in {elapsed:.2f} s ({count / max(elapsed, 1e-9):,.0f} rows/s)",
+          file=sys.stderr)
+    db.close_all()
+
+
+if __name__ == '__main__':
+    main()